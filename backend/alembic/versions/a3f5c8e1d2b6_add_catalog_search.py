@@ -0,0 +1,59 @@
+"""Add catalog search
+
+Revision ID: a3f5c8e1d2b6
+Revises: 7c1e2f9a4b3d
+Create Date: 2026-10-18 14:03:27.931742
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3f5c8e1d2b6'
+down_revision: Union[str, None] = '7c1e2f9a4b3d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        op.execute("CREATE VIRTUAL TABLE catalog_search USING fts5(kind UNINDEXED, key UNINDEXED, name, body, tokenize = 'unicode61 remove_diacritics 2')")
+        for table, key, body in (("villager", "villager_id", "quote"), ("gyroid", "gyroid_name", "sound")):
+            name = "name" if table == "villager" else "gyroid_name"
+            op.execute(f"INSERT INTO catalog_search (kind, key, name, body) SELECT '{table}', {key}, {name}, {body} FROM {table}")
+            op.execute(f"""
+                CREATE TRIGGER {table}_search_insert AFTER INSERT ON {table} BEGIN
+                    INSERT INTO catalog_search (kind, key, name, body) VALUES ('{table}', new.{key}, new.{name}, new.{body});
+                END
+            """)
+            op.execute(f"""
+                CREATE TRIGGER {table}_search_delete AFTER DELETE ON {table} BEGIN
+                    DELETE FROM catalog_search WHERE kind = '{table}' AND key = old.{key};
+                END
+            """)
+            op.execute(f"""
+                CREATE TRIGGER {table}_search_update AFTER UPDATE ON {table} BEGIN
+                    DELETE FROM catalog_search WHERE kind = '{table}' AND key = old.{key};
+                    INSERT INTO catalog_search (kind, key, name, body) VALUES ('{table}', new.{key}, new.{name}, new.{body});
+                END
+            """)
+    elif dialect == "postgresql":
+        op.create_index('ix_villager_search', 'villager', [sa.text("to_tsvector('simple', name || ' ' || quote)")], postgresql_using='gin')
+        op.create_index('ix_gyroid_search', 'gyroid', [sa.text("to_tsvector('simple', gyroid_name || ' ' || sound)")], postgresql_using='gin')
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        for table in ("villager", "gyroid"):
+            for event in ("insert", "delete", "update"):
+                op.execute(f"DROP TRIGGER {table}_search_{event}")
+        op.execute("DROP TABLE catalog_search")
+    elif dialect == "postgresql":
+        op.drop_index('ix_gyroid_search', table_name='gyroid')
+        op.drop_index('ix_villager_search', table_name='villager')
@@ -0,0 +1,49 @@
+"""Add island counts
+
+Revision ID: d4b7e2a9c1f3
+Revises: a3f5c8e1d2b6
+Create Date: 2026-10-18 16:41:09.218374
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4b7e2a9c1f3'
+down_revision: Union[str, None] = 'a3f5c8e1d2b6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('gyroidislandcount',
+    sa.Column('gyroid_name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('islands', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['gyroid_name'], ['gyroid.gyroid_name'], ),
+    sa.PrimaryKeyConstraint('gyroid_name')
+    )
+    op.create_table('nativefruitcount',
+    sa.Column('native_fruit', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('users', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('native_fruit')
+    )
+    op.create_table('villagerislandcount',
+    sa.Column('villager_id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('islands', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['villager_id'], ['villager.villager_id'], ),
+    sa.PrimaryKeyConstraint('villager_id')
+    )
+    # backfill from the existing islands, the same queries as `python -m analytics rebuild`
+    op.execute("INSERT INTO villagerislandcount (villager_id, islands) SELECT villager_id, count(*) FROM uservillagerlink GROUP BY villager_id")
+    op.execute("INSERT INTO gyroidislandcount (gyroid_name, islands) SELECT gyroid_name, count(*) FROM usergyroidlink GROUP BY gyroid_name")
+    op.execute("INSERT INTO nativefruitcount (native_fruit, users) SELECT native_fruit, count(*) FROM users GROUP BY native_fruit")
+
+
+def downgrade() -> None:
+    op.drop_table('villagerislandcount')
+    op.drop_table('nativefruitcount')
+    op.drop_table('gyroidislandcount')
@@ -0,0 +1,114 @@
+"""Island population statistics backed by incrementally maintained counts.
+
+The write endpoints adjust ``villagerislandcount``, ``gyroidislandcount``
+and ``nativefruitcount`` in the same transaction as the link or user change,
+so the /stats endpoints read a few hundred summary rows instead of
+aggregating the link tables. If the counts ever drift, rebuild them from
+the backend folder:
+
+    python -m analytics rebuild
+"""
+from sqlalchemy import delete, func, insert, select
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import crud
+import models
+import schemas
+
+import argparse
+
+
+COUNTERS = {
+    "villagers": (models.VillagerIslandCount, "villager_id", "islands"),
+    "gyroids": (models.GyroidIslandCount, "gyroid_name", "islands"),
+    "fruit": (models.NativeFruitCount, "native_fruit", "users"),
+}
+
+
+def bump_statement(dialect: str, counter: str, deltas: dict[str, int]):
+    model, key, column = COUNTERS[counter]
+    table = model.__table__
+    stmt = crud.dialect_insert(dialect)(table).values([{key: value, column: delta} for value, delta in deltas.items()])
+    return stmt.on_conflict_do_update(index_elements=[key], set_={column: table.c[column] + stmt.excluded[column]})
+
+async def bump(db: AsyncSession, counter: str, deltas: dict[str, int]):
+    """Adjust counts inside the caller's transaction, so they commit or roll back with the change they describe."""
+    deltas = {value: delta for value, delta in deltas.items() if delta}
+    if deltas:
+        await db.exec(bump_statement(db.bind.dialect.name, counter, deltas))
+
+
+def to_shares(rows) -> list[schemas.PopulationShare]:
+    total = sum(count for _, count in rows)
+    return [schemas.PopulationShare(key=key, count=count, share=round(count / total, 4)) for key, count in rows]
+
+async def villager_distribution(db: AsyncSession, field: str) -> list[schemas.PopulationShare]:
+    counts = models.VillagerIslandCount
+    column = getattr(models.Villager, field)
+    residents = func.sum(counts.islands)
+    statement = (
+        select(column, residents)
+        .join(counts, counts.villager_id == models.Villager.villager_id)
+        .where(counts.islands > 0)
+        .group_by(column)
+        .order_by(residents.desc(), column)
+    )
+    return to_shares((await db.exec(statement)).all())
+
+async def popular_villagers(db: AsyncSession, limit: int) -> list[schemas.PopularItem]:
+    counts = models.VillagerIslandCount
+    statement = (
+        select(models.Villager.villager_id, models.Villager.name, counts.islands)
+        .join(counts, counts.villager_id == models.Villager.villager_id)
+        .where(counts.islands > 0)
+        .order_by(counts.islands.desc(), models.Villager.villager_id)
+        .limit(limit)
+    )
+    return [schemas.PopularItem(id=villager_id, name=name, islands=islands) for villager_id, name, islands in (await db.exec(statement)).all()]
+
+async def popular_gyroids(db: AsyncSession, limit: int) -> list[schemas.PopularItem]:
+    counts = models.GyroidIslandCount
+    statement = (
+        select(counts.gyroid_name, counts.islands)
+        .where(counts.islands > 0)
+        .order_by(counts.islands.desc(), counts.gyroid_name)
+        .limit(limit)
+    )
+    return [schemas.PopularItem(id=name, name=name, islands=islands) for name, islands in (await db.exec(statement)).all()]
+
+async def native_fruit_shares(db: AsyncSession) -> list[schemas.PopulationShare]:
+    counts = models.NativeFruitCount
+    statement = select(counts.native_fruit, counts.users).where(counts.users > 0).order_by(counts.users.desc(), counts.native_fruit)
+    return to_shares((await db.exec(statement)).all())
+
+
+def rebuild(db: Session) -> dict[str, int]:
+    """Recompute every count from the link and user tables. Does not commit."""
+    sources = {
+        "villagers": select(models.UserVillagerLink.villager_id, func.count()).group_by(models.UserVillagerLink.villager_id),
+        "gyroids": select(models.UserGyroidLink.gyroid_name, func.count()).group_by(models.UserGyroidLink.gyroid_name),
+        "fruit": select(models.Users.native_fruit, func.count()).group_by(models.Users.native_fruit),
+    }
+    rows = {}
+    for counter, source in sources.items():
+        model, key, column = COUNTERS[counter]
+        db.exec(delete(model))
+        rows[counter] = db.exec(insert(model).from_select([key, column], source)).rowcount
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("rebuild", help="recompute the island statistics from the link tables")
+    parser.parse_args()
+
+    from database import engine
+
+    with Session(engine) as db:
+        rows = rebuild(db)
+        db.commit()
+    print(", ".join(f"{counter}: {count} rows" for counter, count in rows.items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Measure the memory held per cached villager and gyroid.
+
+Compares a catalog of pydantic models (the previous representation) with
+the compact records in compact.py, with and without the villager index.
+Sizes are the deep size of everything the catalog keeps alive. Shared
+singletons such as enum members and small ints are not counted, and an
+object reachable twice is counted once. Run from the backend folder:
+
+    python -m benchmarks.bench_memory --villagers 413 --gyroids 200
+"""
+from benchmarks.fake_nookipedia import make_gyroid_payload, make_villager_payload
+import catalog
+import schemas
+
+from enum import Enum
+import argparse
+import json
+import sys
+
+
+def pydantic_villagers(payload: list[dict]) -> tuple:
+    return tuple(
+        schemas.Villager(
+            villager_id=record["id"],
+            name=record["name"],
+            species=record["species"].lower(),
+            personality=record["personality"].lower(),
+            quote=record["quote"],
+        )
+        for record in payload
+    )
+
+def pydantic_gyroids(payload: list[dict]) -> tuple:
+    return tuple(schemas.Gyroid(name=record["name"], sound=record["sound"]) for record in payload)
+
+def deep_size(root, exclude: set[int] | None = None) -> tuple[int, set[int]]:
+    """Return the deep size of ``root`` and the ids it counted, skipping ids in ``exclude``."""
+    seen = set(exclude or ())
+    counted = set()
+    stack = [root]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or obj is None or isinstance(obj, (bool, Enum, type)):
+            continue
+        if isinstance(obj, int) and -5 <= obj <= 256:
+            continue
+        seen.add(id(obj))
+        counted.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif not isinstance(obj, (str, bytes, int, float)):
+            for cls in type(obj).__mro__:
+                for name in getattr(cls, "__slots__", ()):
+                    stack.append(getattr(obj, name, None))
+            if hasattr(obj, "__dict__"):
+                stack.append(obj.__dict__)
+    return total, counted
+
+def report(label: str, size: int, count: int):
+    print(f"{label:<34} {size / 1024:9.1f} KiB   {size / count:7.0f} bytes per record")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--villagers", type=int, default=413)
+    parser.add_argument("--gyroids", type=int, default=200)
+    args = parser.parse_args()
+
+    villagers_json = json.dumps(make_villager_payload(args.villagers))
+    gyroids_json = json.dumps(make_gyroid_payload(args.gyroids))
+
+    models = pydantic_villagers(json.loads(villagers_json))
+    report("villagers, pydantic models", deep_size(models)[0], args.villagers)
+    report("villagers, pydantic models + index", deep_size((models, catalog.VillagerIndex(models)))[0], args.villagers)
+
+    compact = catalog.parse_villagers(json.loads(villagers_json))
+    size, counted = deep_size(compact)
+    report("villagers, compact", size, args.villagers)
+    report("villagers, compact + index", deep_size((compact, catalog.VillagerIndex(compact)))[0], args.villagers)
+    # while the current catalog is alive, a refresh reuses its interned ids and names
+    refreshed = catalog.parse_villagers(json.loads(villagers_json))
+    report("villagers, compact, next refresh", deep_size(refreshed, exclude=counted)[0], args.villagers)
+
+    report("gyroids, pydantic models", deep_size(pydantic_gyroids(json.loads(gyroids_json)))[0], args.gyroids)
+    report("gyroids, compact", deep_size(catalog.parse_gyroids(json.loads(gyroids_json)))[0], args.gyroids)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Compare full response.json() parsing with the paths of catalog.read_records.
+
+Builds a Nookipedia-sized villager payload, then parses it into catalog
+records with response.json(), with the whole-body orjson path read_records
+takes for small sized bodies, and with the streaming projected parser,
+reporting median time and peak traced memory. Streaming trades CPU for
+memory: it is expected to be slower than decoding the whole body and to
+peak several times lower. The streaming path needs ijson. Run from the
+backend folder:
+
+    python -m benchmarks.bench_parse --villagers 413 --repeat 10
+    python -m benchmarks.bench_parse --villagers 5000 --chunk-size 16384
+"""
+import httpx
+
+from benchmarks.fake_nookipedia import make_villager_payload
+import catalog
+
+from unittest.mock import patch
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import tracemalloc
+
+
+def make_response(body: bytes, chunk_size: int, sized: bool = False) -> httpx.Response:
+    async def chunks():
+        for i in range(0, len(body), chunk_size):
+            yield body[i:i + chunk_size]
+    headers = {"Content-Length": str(len(body))} if sized else None
+    return httpx.Response(200, content=chunks(), headers=headers)
+
+async def full_json(body: bytes, chunk_size: int):
+    response = make_response(body, chunk_size)
+    await response.aread()
+    return catalog.parse_villagers(response.json())
+
+async def whole_body(body: bytes, chunk_size: int):
+    with patch("catalog.CATALOG_STREAM_MIN_BYTES", len(body) + 1):
+        records = await catalog.read_records(make_response(body, chunk_size, sized=True), catalog.CATALOG_FIELDS["villagers"])
+    return catalog.parse_villagers(records)
+
+async def streaming(body: bytes, chunk_size: int):
+    records = await catalog.read_records(make_response(body, chunk_size), catalog.CATALOG_FIELDS["villagers"])
+    return catalog.parse_villagers(records)
+
+def measure(parse, body: bytes, chunk_size: int, repeat: int) -> tuple[float, int, int]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        villagers = asyncio.run(parse(body, chunk_size))
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    asyncio.run(parse(body, chunk_size))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak, len(villagers)
+
+def report(label: str, seconds: float, peak: int, count: int):
+    print(f"{label:<22} {seconds * 1000:9.2f} ms   peak {peak / 1024 / 1024:8.2f} MiB   {count} villagers")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--villagers", type=int, default=413)
+    parser.add_argument("--chunk-size", type=int, default=65536)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    if catalog.ijson is None:
+        parser.error("the streaming parser needs ijson (pip install ijson)")
+
+    body = json.dumps(make_villager_payload(args.villagers)).encode()
+    print(f"payload {len(body) / 1024:.0f} KiB, ijson backend {catalog.ijson.backend}")
+    full = measure(full_json, body, args.chunk_size, args.repeat)
+    small = measure(whole_body, body, args.chunk_size, args.repeat)
+    stream = measure(streaming, body, args.chunk_size, args.repeat)
+    report("response.json()", *full)
+    report("orjson whole body", *small)
+    report("streaming projection", *stream)
+    print(f"streaming takes {stream[0] / full[0]:.1f}x the time with {full[1] / stream[1]:.1f}x lower peak memory")
+
+if __name__ == "__main__":
+    main()
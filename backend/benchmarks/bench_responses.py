@@ -0,0 +1,105 @@
+"""Compare per-request response serialization with the cached JSON bodies.
+
+First times the work FastAPI used to do for every /villagers response
+(validate list[schemas.Villager] and encode it) against a cached-body
+lookup. Then drives /villagers and /gyroids in-process and profiles the
+requests, to show that serialization no longer appears on the hot path.
+Run from the backend folder:
+
+    python -m benchmarks.bench_responses --villagers 413 --requests 2000
+"""
+from pydantic import TypeAdapter
+import httpx
+
+from benchmarks.fake_nookipedia import make_gyroid_payload, make_villager_payload
+import catalog
+import schemas
+
+import argparse
+import asyncio
+import cProfile
+import os
+import pstats
+import statistics
+import time
+
+
+SERIALIZATION_FUNCTIONS = ("model_dump", "dump_json", "validate_python", "dumps", "serialize_response", "jsonable_encoder")
+
+
+def timed(function, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+def compare_serialization(entry: catalog.CatalogEntry, repeat: int):
+    adapter = TypeAdapter(list[schemas.Villager])
+    species = [schemas.Species.CAT, schemas.Species.DOG, schemas.Species.BIRD]
+    key = (tuple(sorted(s.value for s in species)), ())
+
+    def per_request():
+        villagers = list(entry.index.lookup(species))
+        adapter.dump_json(adapter.validate_python(villagers, from_attributes=True))
+
+    def cached():
+        entry.body(key, lambda: entry.index.lookup(species))
+
+    per_request_us = timed(per_request, repeat) * 1e6
+    cached_us = timed(cached, repeat) * 1e6
+    print(f"{'validate + encode':<24} {per_request_us:9.1f} us")
+    print(f"{'cached body':<24} {cached_us:9.1f} us   speedup {per_request_us / cached_us:7.1f}x")
+
+async def drive(app, requests: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        start = time.perf_counter()
+        for i in range(requests):
+            if i % 2:
+                await client.get("/villagers", params=[("species", "cat"), ("species", "dog")])
+            else:
+                await client.get("/gyroids")
+        return time.perf_counter() - start
+
+def profile_requests(villagers: int, gyroids: int, requests: int):
+    os.environ.setdefault("DATABASE_URL", "sqlite://")
+    from main import app, catalog_cache
+
+    catalog_cache.load("villagers", catalog.parse_villagers(make_villager_payload(villagers)))
+    catalog_cache.load("gyroids", catalog.parse_gyroids(make_gyroid_payload(gyroids)))
+    asyncio.run(drive(app, 10))
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    elapsed = asyncio.run(drive(app, requests))
+    profiler.disable()
+
+    stats = pstats.Stats(profiler)
+    total = stats.total_tt
+    serialization = sum(
+        cumulative
+        for (filename, line, name), (calls, _, own, cumulative, callers) in stats.stats.items()
+        if name in SERIALIZATION_FUNCTIONS and not any(caller[2] in SERIALIZATION_FUNCTIONS for caller in callers)
+    )
+    print(f"{requests} requests in {elapsed:.2f} s ({requests / elapsed:.0f} req/s under the profiler)")
+    print(f"serialization share of profile: {serialization / total:.2%}")
+    stats.sort_stats("tottime").print_stats(10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--villagers", type=int, default=413)
+    parser.add_argument("--gyroids", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    cache = catalog.CatalogCache(None)
+    entry = cache.load("villagers", catalog.parse_villagers(make_villager_payload(args.villagers)))
+    compare_serialization(entry, args.repeat)
+    profile_requests(args.villagers, args.gyroids, args.requests)
+
+if __name__ == "__main__":
+    main()
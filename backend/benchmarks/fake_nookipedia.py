@@ -0,0 +1,145 @@
+"""Local stand-in for the Nookipedia API, for benchmarks and load tests.
+
+Serves /villagers and /nh/gyroids payloads shaped like the real ones, with
+optional added latency and failure injection. Honours If-None-Match, so
+catalog revalidation can be exercised too. Run from the backend folder:
+
+    python -m benchmarks.fake_nookipedia --villagers 413 --latency 0.05 --failure-rate 0.01
+
+and point the API at it with NOOKIPEDIA_URL=http://127.0.0.1:8001.
+"""
+from fastapi import FastAPI, Request, Response
+
+import schemas
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+
+
+SPECIES = list(schemas.Species)
+PERSONALITIES = list(schemas.Personality)
+FAILURE_STATUS_CODES = (500, 502, 503)
+
+
+def make_villager_payload(count: int) -> list[dict]:
+    # Nookipedia returns about 4 KB per villager once every field is included
+    return [
+        {
+            "id": f"vil{i:05d}",
+            "name": f"Villager {i}",
+            "url": f"https://nookipedia.com/wiki/Villager_{i}",
+            "alt_name": "",
+            "title_color": "bfab5b",
+            "text_color": "fffce9",
+            "image_url": f"https://dodo.ac/np/images/villager_{i}.png",
+            "species": SPECIES[i % len(SPECIES)].value.title(),
+            "personality": PERSONALITIES[i % len(PERSONALITIES)].value.title(),
+            "gender": "Female" if i % 2 else "Male",
+            "birthday_month": "January",
+            "birthday_day": str(i % 28 + 1),
+            "sign": "Capricorn",
+            "quote": f"Quote number {i}.",
+            "phrase": f"phrase{i}",
+            "clothing": "Simple shirt",
+            "islander": False,
+            "debut": "DNM",
+            "prev_phrases": [],
+            "appearances": ["DNM", "AC", "E_PLUS", "WW", "CF", "NL", "WA", "NH", "HHD", "PC"],
+            "nh_details": {
+                "image_url": f"https://dodo.ac/np/images/nh_villager_{i}.png",
+                "photo_url": f"https://dodo.ac/np/images/nh_photo_{i}.png",
+                "icon_url": f"https://dodo.ac/np/images/nh_icon_{i}.png",
+                "quote": f"Quote number {i}.",
+                "sub-personality": "A",
+                "catchphrase": f"phrase{i}",
+                "clothing": "Simple shirt",
+                "clothing_variation": "Blue",
+                "fav_styles": ["Simple", "Cool"],
+                "fav_colors": ["Blue", "White"],
+                "hobby": "Nature",
+                "house_interior_url": f"https://dodo.ac/np/images/house_{i}.png",
+                "house_exterior_url": f"https://dodo.ac/np/images/house_ext_{i}.png",
+                "house_wallpaper": "Wooden wall",
+                "house_flooring": "Wooden floor",
+                "house_music": "K.K. Bossa",
+                "house_music_note": "",
+                "umbrella": "Leaf umbrella",
+            },
+        }
+        for i in range(count)
+    ]
+
+def make_gyroid_payload(count: int) -> list[dict]:
+    return [
+        {
+            "name": f"Gyroid {i}",
+            "url": f"https://nookipedia.com/wiki/Gyroid_{i}",
+            "sound": ("Melody", "Crash", "Drum set", "Hi-hat", "Kick", "Snare")[i % 6],
+            "customizable": bool(i % 2),
+            "custom_kits": 1,
+            "custom_kit_type": "Cushion",
+            "custom_body_part": "Body",
+            "cyrus_price": 0,
+            "number_of_variations": 3,
+            "variation_total": 3,
+            "hha_base": 251,
+            "buy": [],
+            "sell": 800,
+            "availability": [{"from": "Digging", "note": "After rain"}],
+            "notes": "",
+            "variations": [
+                {"variation": color, "image_url": f"https://dodo.ac/np/images/gyroid_{i}_{color}.png", "colors": [color]}
+                for color in ("Green", "Red", "Blue")
+            ],
+        }
+        for i in range(count)
+    ]
+
+
+def create_app(villagers: int = 413, gyroids: int = 200, latency: float = 0.0, failure_rate: float = 0.0, seed: int = 1) -> FastAPI:
+    app = FastAPI()
+    rng = random.Random(seed)
+    bodies = {}
+    for path, payload in (("/villagers", make_villager_payload(villagers)), ("/nh/gyroids", make_gyroid_payload(gyroids))):
+        body = json.dumps(payload).encode()
+        bodies[path] = (body, f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"')
+    app.state.calls = {path: 0 for path in bodies}
+
+    async def serve(request: Request) -> Response:
+        path = request.url.path
+        app.state.calls[path] += 1
+        if latency:
+            await asyncio.sleep(rng.uniform(latency * 0.5, latency * 1.5))
+        if failure_rate and rng.random() < failure_rate:
+            return Response(status_code=rng.choice(FAILURE_STATUS_CODES))
+        body, etag = bodies[path]
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(body, media_type="application/json", headers={"ETag": etag})
+
+    for path in bodies:
+        app.add_api_route(path, serve, methods=["GET"])
+    return app
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--villagers", type=int, default=413)
+    parser.add_argument("--gyroids", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0, help="mean upstream latency in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of calls answered with a 5xx")
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args()
+    app = create_app(args.villagers, args.gyroids, args.latency, args.failure_rate)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
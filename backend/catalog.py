@@ -0,0 +1,465 @@
+from collections import defaultdict
+from dataclasses import dataclass, field, replace
+from functools import partial
+from decouple import config
+import httpx
+import orjson
+
+from pydantic import ValidationError
+from compact import CompactGyroid, CompactVillager
+from upstream import CircuitOpenError, UpstreamClient, UpstreamError, parse_retry_after
+import schemas
+
+from typing import AsyncIterator, Awaitable, Callable, Iterable
+import asyncio
+import hashlib
+import heapq
+import logging
+import time
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+PARSE_ERRORS = (ValueError, ijson.JSONError) if ijson is not None else (ValueError,)
+
+
+CATALOG_TTL = config("CATALOG_TTL", default=300.0, cast=float)
+CATALOG_STALE_TTL = config("CATALOG_STALE_TTL", default=3600.0, cast=float)
+CATALOG_BODY_CACHE_SIZE = config("CATALOG_BODY_CACHE_SIZE", default=512, cast=int)
+CATALOG_STREAM_MIN_BYTES = config("CATALOG_STREAM_MIN_BYTES", default=256 * 1024, cast=int)
+
+CATALOG_RESOURCES: dict[str, tuple[str, str]] = {
+    "villagers": ("/villagers", "Failed to fetch villagers from API"),
+    "gyroids": ("/nh/gyroids", "Failed to fetch gyroids from API"),
+}
+
+logger = logging.getLogger(__name__)
+
+
+def parse_villagers(payload: list[dict]) -> tuple[CompactVillager, ...]:
+    villagers: dict[str, CompactVillager] = {}
+    for villager_json in payload:
+        try:
+            villager = schemas.Villager(
+                villager_id=villager_json["id"],
+                name=villager_json["name"],
+                species=villager_json["species"].lower(),
+                personality=villager_json["personality"].lower(),
+                quote=villager_json["quote"]
+            )
+        except (KeyError, AttributeError, ValidationError):
+            logger.warning("Skipping malformed villager record %r", villager_json.get("id"))
+            continue
+        if villager.villager_id not in villagers:
+            villagers[villager.villager_id] = CompactVillager.from_model(villager)
+    # sorted by key, the canonical catalog order, so every worker builds the same digest and ETag
+    return tuple(villagers[villager_id] for villager_id in sorted(villagers))
+
+def parse_gyroids(payload: list[dict]) -> tuple[CompactGyroid, ...]:
+    gyroids: dict[str, CompactGyroid] = {}
+    for gyroid_json in payload:
+        try:
+            gyroid = schemas.Gyroid(
+                name=gyroid_json["name"],
+                sound=gyroid_json["sound"]
+            )
+        except (KeyError, ValidationError):
+            logger.warning("Skipping malformed gyroid record %r", gyroid_json.get("name"))
+            continue
+        if gyroid.name not in gyroids:
+            gyroids[gyroid.name] = CompactGyroid.from_model(gyroid)
+    return tuple(gyroids[name] for name in sorted(gyroids))
+
+CATALOG_PARSERS = {
+    "villagers": parse_villagers,
+    "gyroids": parse_gyroids,
+}
+
+# the only upstream fields the parsers read; everything else is skipped while streaming
+CATALOG_FIELDS = {
+    "villagers": ("id", "name", "species", "personality", "quote"),
+    "gyroids": ("name", "sound"),
+}
+
+
+class ChunkReader:
+    """File-like ``read(size)`` over an async iterator of byte chunks, for ijson."""
+
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self.chunks = chunks
+        self.buffer = b""
+
+    async def read(self, size: int) -> bytes:
+        while len(self.buffer) < size:
+            chunk = await anext(self.chunks, b"")
+            if not chunk:
+                break
+            self.buffer += chunk
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def is_small_body(response: httpx.Response) -> bool:
+    # only plain bodies qualify: a compressed Content-Length says little about the decoded size
+    if response.headers.get("Content-Encoding", "identity") != "identity":
+        return False
+    length = response.headers.get("Content-Length", "")
+    return length.isdigit() and int(length) < CATALOG_STREAM_MIN_BYTES
+
+async def read_records(response: httpx.Response, fields: Iterable[str]) -> list[dict]:
+    """Read a JSON array of records from ``response``, keeping only ``fields``.
+
+    Large or unsized bodies are parsed incrementally with ijson as chunks
+    arrive, and each record is cut down to the projected fields as soon as
+    it is complete, so the full payload never exists as one dict tree. This
+    trades CPU for memory: on the real catalog it is slower than decoding
+    the whole body but peaks several times lower. Bodies declared smaller
+    than CATALOG_STREAM_MIN_BYTES, or everything when ijson is missing, are
+    read whole and decoded with orjson, which is the fastest path.
+    """
+    fields = tuple(fields)
+    if ijson is None or is_small_body(response):
+        await response.aread()
+        payload = orjson.loads(response.content)
+        if not isinstance(payload, list):
+            return []
+        return [{name: item[name] for name in fields if name in item} for item in payload if isinstance(item, dict)]
+
+    records: list[dict] = []
+    # one record is materialized at a time and cut down to the projected fields
+    async for item in ijson.items_async(ChunkReader(response.aiter_bytes()), "item", use_float=True):
+        if isinstance(item, dict):
+            records.append({name: item[name] for name in fields if name in item})
+    return records
+
+
+class VillagerIndex:
+    """Inverted index of a villager catalog by species and personality.
+
+    Built once per refresh; every key maps straight to a tuple of validated
+    records in catalog order, so single-key lookups are one dict hit and
+    multi-value filters are a merge of disjoint postings.
+    """
+
+    def __init__(self, villagers: tuple[CompactVillager, ...]):
+        self.positions = {villager.villager_id: i for i, villager in enumerate(villagers)}
+        by_species = defaultdict(list)
+        by_personality = defaultdict(list)
+        by_pair = defaultdict(list)
+        for villager in villagers:
+            by_species[villager.species].append(villager)
+            by_personality[villager.personality].append(villager)
+            by_pair[(villager.species, villager.personality)].append(villager)
+        self.by_species = {key: tuple(value) for key, value in by_species.items()}
+        self.by_personality = {key: tuple(value) for key, value in by_personality.items()}
+        self.by_pair = {key: tuple(value) for key, value in by_pair.items()}
+
+    def lookup(self, species: Iterable[schemas.Species] = (), personality: Iterable[schemas.Personality] = ()) -> tuple[CompactVillager, ...]:
+        species = tuple(dict.fromkeys(species))
+        personality = tuple(dict.fromkeys(personality))
+        if species and personality:
+            postings = [self.by_pair.get((s, p), ()) for s in species for p in personality]
+        elif species:
+            postings = [self.by_species.get(s, ()) for s in species]
+        else:
+            postings = [self.by_personality.get(p, ()) for p in personality]
+
+        postings = [posting for posting in postings if posting]
+        if not postings:
+            return ()
+        if len(postings) == 1:
+            return postings[0]
+        return tuple(heapq.merge(*postings, key=lambda villager: self.positions[villager.villager_id]))
+
+CATALOG_INDEXERS = {
+    "villagers": VillagerIndex,
+}
+
+def catalog_digest(items: tuple) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for item in items:
+        digest.update(orjson.dumps(item.model_dump(mode="json")))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    items: tuple
+    etag: str | None
+    last_modified: str | None
+    fetched_at: float
+    digest: str = ""
+    index: VillagerIndex | None = None
+    bodies: dict = field(default_factory=dict, compare=False, repr=False)
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+    def body(self, key: tuple, items: Callable[[], Iterable]) -> bytes:
+        """Return the JSON body for ``key``, serializing ``items()`` only on first use.
+
+        Bodies live on the entry, so they are dropped with it when the catalog
+        changes and kept when a revalidation only bumps ``fetched_at``.
+        """
+        body = self.bodies.get(key)
+        if body is None:
+            body = orjson.dumps([item.model_dump(mode="json") for item in items()])
+            if len(self.bodies) >= CATALOG_BODY_CACHE_SIZE:
+                self.bodies.pop(next(iter(self.bodies)))
+            self.bodies[key] = body
+        return body
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    villagers: CatalogEntry | None = None
+    gyroids: CatalogEntry | None = None
+    version: int = 0
+
+
+@dataclass
+class CatalogCounters:
+    hits: int = 0
+    misses: int = 0
+    stale_hits: int = 0
+    revalidations: int = 0
+    refreshes: int = 0
+    errors: int = 0
+    coalesced: int = 0
+    fallbacks: int = 0
+
+
+class CatalogCache:
+    """In-memory cache of the upstream catalog.
+
+    The parsed catalog lives in an immutable ``CatalogSnapshot`` that is
+    replaced as a whole on refresh, so readers always see a consistent,
+    deduplicated copy and memory is bounded by the catalog size.
+
+    Entries younger than ``ttl`` are served directly. Up to ``stale_ttl`` past
+    that they are still served while a background task revalidates them with
+    ``If-None-Match``/``If-Modified-Since``; older entries are revalidated
+    before answering.
+
+    Concurrent refreshes of the same resource share one in-flight upstream
+    fetch and its parsed result; callers that joined an existing fetch are
+    counted as ``coalesced``.
+
+    When a refresh fails because upstream is down, rate limiting us or behind
+    an open circuit, ``get`` falls back to the last good copy: the expired
+    entry if there is one, otherwise whatever the fallback loader (the
+    database) returns. Those lookups are counted as ``fallbacks``.
+
+    A ``follower`` cache belongs to a worker that another worker refreshes
+    for (see shared.py): ``get`` never calls upstream, serves expired
+    entries until a new version is loaded into it, and on a cold miss only
+    tries the fallback loader.
+    """
+
+    def __init__(self, upstream_client: UpstreamClient, ttl: float = CATALOG_TTL, stale_ttl: float = CATALOG_STALE_TTL):
+        self.upstream_client = upstream_client
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.snapshot = CatalogSnapshot()
+        self._inflight: dict[str, asyncio.Task] = {}
+        self.counters = {resource: CatalogCounters() for resource in CATALOG_RESOURCES}
+        self._listeners: list[Callable[[str, tuple], None]] = []
+        self._fallback: Callable[[str], Awaitable[tuple]] | None = None
+        self.follower = False
+
+    def set_fallback(self, loader: Callable[[str], Awaitable[tuple]]):
+        self._fallback = loader
+
+    def subscribe(self, listener: Callable[[str, tuple], None]):
+        self._listeners.append(listener)
+
+    def _notify(self, resource: str, items: tuple):
+        for listener in self._listeners:
+            listener(resource, items)
+
+    def clear(self):
+        self.snapshot = CatalogSnapshot()
+        self._inflight.clear()
+        self.counters = {resource: CatalogCounters() for resource in CATALOG_RESOURCES}
+        for resource in CATALOG_RESOURCES:
+            self._notify(resource, ())
+
+    async def get(self, resource: str) -> CatalogEntry:
+        counters = self.counters[resource]
+        entry = getattr(self.snapshot, resource)
+        if entry is None:
+            counters.misses += 1
+            if self.follower:
+                return await self._follower_miss(resource)
+            return await self._refresh_or_fall_back(resource, entry)
+
+        age = entry.age
+        if age < self.ttl:
+            counters.hits += 1
+            return entry
+        if self.follower or age < self.ttl + self.stale_ttl:
+            counters.stale_hits += 1
+            self._refresh_in_background(resource)
+            return entry
+
+        counters.misses += 1
+        return await self._refresh_or_fall_back(resource, entry)
+
+    async def _refresh_or_fall_back(self, resource: str, entry: CatalogEntry | None) -> CatalogEntry:
+        try:
+            return await self.refresh(resource)
+        except UpstreamError as exc:
+            if exc.status_code < 500 and exc.status_code != 429:
+                raise
+            fallback = entry or await self._load_fallback(resource)
+            if fallback is None:
+                raise
+            self.counters[resource].fallbacks += 1
+            return fallback
+
+    async def _follower_miss(self, resource: str) -> CatalogEntry:
+        entry = await self._load_fallback(resource)
+        if entry is None:
+            raise UpstreamError(503, f"The {resource} catalog is not loaded yet", retry_after=1.0)
+        self.counters[resource].fallbacks += 1
+        return entry
+
+    async def _load_fallback(self, resource: str) -> CatalogEntry | None:
+        if self._fallback is None:
+            return None
+        try:
+            items = await self._fallback(resource)
+        except Exception:
+            logger.warning("Could not load the %s catalog fallback", resource, exc_info=True)
+            return None
+        if not items:
+            return None
+        # loaded as already expired, so the next lookup revalidates it in the background
+        return self.load(resource, items, age=self.ttl)
+
+    async def refresh(self, resource: str) -> CatalogEntry:
+        # shielded so a caller that gives up does not cancel the fetch for everyone else
+        return await asyncio.shield(self._join_fetch(resource))
+
+    def _join_fetch(self, resource: str) -> asyncio.Task:
+        task = self._inflight.get(resource)
+        if task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop():
+            self.counters[resource].coalesced += 1
+            return task
+
+        task = asyncio.create_task(self._fetch(resource))
+        self._inflight[resource] = task
+        task.add_done_callback(lambda done: self._inflight.pop(resource, None) if self._inflight.get(resource) is done else None)
+        return task
+
+    async def _fetch(self, resource: str) -> CatalogEntry:
+        path, detail = CATALOG_RESOURCES[resource]
+        counters = self.counters[resource]
+        entry = getattr(self.snapshot, resource)
+
+        request_headers = {}
+        if entry is not None:
+            if entry.etag:
+                request_headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                request_headers["If-Modified-Since"] = entry.last_modified
+
+        try:
+            response = await self.upstream_client.get(path, headers=request_headers, stream=True)
+        except httpx.HTTPError:
+            counters.errors += 1
+            raise UpstreamError(502, detail)
+
+        try:
+            if response.status_code == 304 and entry is not None:
+                counters.revalidations += 1
+                entry = replace(entry, fetched_at=time.monotonic())
+                self.snapshot = replace(self.snapshot, **{resource: entry})
+                return entry
+
+            if response.status_code != 200:
+                counters.errors += 1
+                raise UpstreamError(response.status_code, detail, retry_after=parse_retry_after(response.headers.get("Retry-After")))
+
+            records = await read_records(response, CATALOG_FIELDS[resource])
+        except (httpx.HTTPError, *PARSE_ERRORS) as exc:
+            counters.errors += 1
+            raise UpstreamError(502, detail) from exc
+        finally:
+            await response.aclose()
+
+        counters.refreshes += 1
+        return self.load(
+            resource,
+            CATALOG_PARSERS[resource](records),
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+
+    def load(self, resource: str, items: tuple, etag: str | None = None, last_modified: str | None = None, age: float = 0.0) -> CatalogEntry:
+        current = getattr(self.snapshot, resource)
+        changed = current is None or current.items != items
+        indexer = CATALOG_INDEXERS.get(resource)
+        entry = CatalogEntry(
+            items=items if changed else current.items,
+            etag=etag,
+            last_modified=last_modified,
+            fetched_at=time.monotonic() - age,
+            digest=catalog_digest(items) if changed else current.digest,
+            index=(indexer(items) if changed else current.index) if indexer else None,
+            bodies={} if changed else current.bodies,
+        )
+        version = self.snapshot.version + 1 if changed else self.snapshot.version
+        self.snapshot = replace(self.snapshot, **{resource: entry}, version=version)
+        if changed:
+            self._notify(resource, items)
+        return entry
+
+    def peek(self, resource: str) -> CatalogEntry | None:
+        return getattr(self.snapshot, resource)
+
+    def revalidate_if_stale(self, resource: str):
+        entry = getattr(self.snapshot, resource)
+        if entry is not None and entry.age >= self.ttl:
+            self._refresh_in_background(resource)
+
+    def _refresh_in_background(self, resource: str):
+        if self.follower:
+            return
+        task = self._inflight.get(resource)
+        if task is not None and not task.done():
+            return
+        self._join_fetch(resource).add_done_callback(partial(self._log_background_failure, resource))
+
+    def _log_background_failure(self, resource: str, task: asyncio.Task):
+        if task.cancelled() or task.exception() is None:
+            return
+        if isinstance(task.exception(), CircuitOpenError):
+            logger.debug("Skipped background refresh of %s catalog, upstream circuit is open", resource)
+        else:
+            logger.error("Background refresh of %s catalog failed", resource, exc_info=task.exception())
+
+    def stats(self) -> dict[str, dict]:
+        stats = {}
+        for resource, counters in self.counters.items():
+            entry = getattr(self.snapshot, resource)
+            lookups = counters.hits + counters.stale_hits + counters.misses
+            stats[resource] = {
+                "age_seconds": round(entry.age, 3) if entry else None,
+                "etag": entry.etag if entry else None,
+                "size": len(entry.items) if entry else 0,
+                "hits": counters.hits,
+                "stale_hits": counters.stale_hits,
+                "misses": counters.misses,
+                "revalidations": counters.revalidations,
+                "refreshes": counters.refreshes,
+                "errors": counters.errors,
+                "coalesced": counters.coalesced,
+                "fallbacks": counters.fallbacks,
+                "hit_ratio": round((counters.hits + counters.stale_hits) / lookups, 4) if lookups else None,
+            }
+        return stats
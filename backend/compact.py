@@ -0,0 +1,98 @@
+"""Compact in-memory records for the cached catalog.
+
+Species and personality are stored as small integer codes into the
+``schemas`` enums, repeated strings are interned, and records use
+``__slots__`` instead of a per-instance dict. They expose the same attributes
+and ``model_dump`` as the pydantic models, so the index, response bodies,
+search and the database upserts use them unchanged. Pydantic models are
+only built by ``to_model`` when something actually needs one.
+"""
+import schemas
+
+import sys
+
+
+SPECIES = tuple(schemas.Species)
+PERSONALITIES = tuple(schemas.Personality)
+SPECIES_CODES = {species: code for code, species in enumerate(SPECIES)}
+PERSONALITY_CODES = {personality: code for code, personality in enumerate(PERSONALITIES)}
+
+
+class CompactVillager:
+    __slots__ = ("villager_id", "name", "species_code", "personality_code", "quote")
+
+    def __init__(self, villager_id: str, name: str, species: schemas.Species, personality: schemas.Personality, quote: str):
+        self.villager_id = sys.intern(villager_id)
+        self.name = sys.intern(name)
+        self.species_code = SPECIES_CODES[species]
+        self.personality_code = PERSONALITY_CODES[personality]
+        self.quote = quote
+
+    @classmethod
+    def from_model(cls, villager) -> "CompactVillager":
+        return cls(villager.villager_id, villager.name, villager.species, villager.personality, villager.quote)
+
+    @property
+    def species(self) -> schemas.Species:
+        return SPECIES[self.species_code]
+
+    @property
+    def personality(self) -> schemas.Personality:
+        return PERSONALITIES[self.personality_code]
+
+    def model_dump(self, mode: str = "python") -> dict:
+        species, personality = self.species, self.personality
+        return {
+            "villager_id": self.villager_id,
+            "name": self.name,
+            "species": species.value if mode == "json" else species,
+            "personality": personality.value if mode == "json" else personality,
+            "quote": self.quote,
+        }
+
+    def to_model(self) -> schemas.Villager:
+        return schemas.Villager.model_construct(**self.model_dump())
+
+    def _key(self) -> tuple:
+        return (self.villager_id, self.name, self.species_code, self.personality_code, self.quote)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, CompactVillager):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self) -> int:
+        return hash(self._key())
+
+    def __repr__(self) -> str:
+        return f"CompactVillager({self.villager_id!r}, {self.name!r}, {self.species.value!r}, {self.personality.value!r})"
+
+
+class CompactGyroid:
+    __slots__ = ("name", "sound")
+
+    def __init__(self, name: str, sound: str):
+        self.name = sys.intern(name)
+        # only a handful of distinct sounds, shared by every gyroid
+        self.sound = sys.intern(sound)
+
+    @classmethod
+    def from_model(cls, gyroid) -> "CompactGyroid":
+        return cls(gyroid.name, gyroid.sound)
+
+    def model_dump(self, mode: str = "python") -> dict:
+        return {"name": self.name, "sound": self.sound}
+
+    def to_model(self) -> schemas.Gyroid:
+        return schemas.Gyroid.model_construct(name=self.name, sound=self.sound)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, CompactGyroid):
+            return NotImplemented
+        return (self.name, self.sound) == (other.name, other.sound)
+
+    def __hash__(self) -> int:
+        return hash((self.name, self.sound))
+
+    def __repr__(self) -> str:
+        return f"CompactGyroid({self.name!r}, {self.sound!r})"
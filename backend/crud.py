@@ -1,8 +1,15 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import selectinload
+from sqlmodel import Session, SQLModel, delete, select, update
+from sqlmodel.sql.expression import SelectOfScalar
 
+from compact import CompactGyroid, CompactVillager
 import models
 import schemas
 
+from typing import Iterable
+import hashlib
+
 def create_villager(db: Session, villager: schemas.Villager):
     db_villager = models.Villager(**villager.model_dump())
     db.add(db_villager)
@@ -11,4 +18,132 @@ def create_villager(db: Session, villager: schemas.Villager):
     return db_villager
 
 def get_villager(db: Session):
-    return db.query(models.Villager).all()
\ No newline at end of file
+    return db.query(models.Villager).all()
+
+USER_RELATIONSHIPS = {
+    "villagers": models.Users.villagers,
+    "gyroids": models.Users.gyroids,
+}
+
+def user_profile_query(user_id: int) -> SelectOfScalar[models.Users]:
+    statement = select(models.Users).where(models.Users.user_id == user_id)
+    return statement.options(*(selectinload(relationship) for relationship in USER_RELATIONSHIPS.values()))
+
+def users_page_query(limit: int, after: int | None = None, native_fruit: str | None = None, expand: Iterable[str] = ()) -> SelectOfScalar[models.Users]:
+    statement = select(models.Users).order_by(models.Users.user_id).limit(limit)
+    statement = statement.options(*(selectinload(USER_RELATIONSHIPS[name]) for name in expand))
+    if after is not None:
+        statement = statement.where(models.Users.user_id > after)
+    if native_fruit is not None:
+        statement = statement.where(models.Users.native_fruit == native_fruit)
+    return statement
+
+def export_users_query(batch_size: int):
+    statement = select(models.Users.user_id, models.Users.username, models.Users.native_fruit)
+    return statement.order_by(models.Users.user_id).execution_options(yield_per=batch_size)
+
+def island_villagers_query(user_ids: list[int]):
+    return select(models.UserVillagerLink.user_id, models.UserVillagerLink.villager_id).where(models.UserVillagerLink.user_id.in_(user_ids))
+
+def island_gyroids_query(user_ids: list[int]):
+    return select(models.UserGyroidLink.user_id, models.UserGyroidLink.gyroid_name).where(models.UserGyroidLink.user_id.in_(user_ids))
+
+def link_islands_statement(dialect: str, link_model: type[SQLModel], key: str, user_id: int, values: Iterable[str]):
+    """Insert link rows for ``values`` in one statement, skipping existing ones.
+
+    Returns the ``key`` of every row actually inserted.
+    """
+    table = link_model.__table__
+    stmt = dialect_insert(dialect)(table).values([{"user_id": user_id, key: value} for value in values])
+    return stmt.on_conflict_do_nothing().returning(table.c[key])
+
+def swap_villager_statement(user_id: int, old_villager_id: str, new_villager_id: str):
+    link = models.UserVillagerLink
+    return (
+        update(link)
+        .where(link.user_id == user_id, link.villager_id == old_villager_id)
+        .values(villager_id=new_villager_id)
+    )
+
+def remove_villager_statement(user_id: int, villager_id: str):
+    link = models.UserVillagerLink
+    return delete(link).where(link.user_id == user_id, link.villager_id == villager_id)
+
+def content_hash(values: Iterable) -> bytes:
+    digest = hashlib.blake2b(digest_size=16)
+    for value in values:
+        digest.update(str(value).encode())
+        digest.update(b"\x1f")
+    return digest.digest()
+
+def dialect_insert(dialect: str):
+    if dialect == "postgresql":
+        return postgresql.insert
+    if dialect == "sqlite":
+        return sqlite.insert
+    raise NotImplementedError(f"Bulk upsert is not supported for {dialect}")
+
+def bulk_upsert(db: Session, model: type[SQLModel], key: str, rows: Iterable[dict]) -> dict[str, int]:
+    """Insert new rows and update changed ones in one batched statement.
+
+    Existing rows are loaded with a single ``IN`` query and compared by
+    content hash, so only new or changed rows are sent back. Does not commit.
+    """
+    table = model.__table__
+    key_column = table.c[key]
+    fields = [column.name for column in table.columns if column.name != key]
+
+    rows_by_key = {row[key]: row for row in rows}
+    existing = {
+        row[0]: content_hash(row[1:])
+        for row in db.exec(select(key_column, *(table.c[field] for field in fields)).where(key_column.in_(rows_by_key)))
+    }
+
+    inserted, updated = [], []
+    for row_key, row in rows_by_key.items():
+        if row_key not in existing:
+            inserted.append(row)
+        elif existing[row_key] != content_hash(row[field] for field in fields):
+            updated.append(row)
+
+    pending = inserted + updated
+    if pending:
+        stmt = dialect_insert(db.get_bind().dialect.name)(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[key_column],
+            set_={field: stmt.excluded[field] for field in fields},
+        )
+        db.exec(stmt, params=pending)
+
+    return {
+        "inserted": len(inserted),
+        "updated": len(updated),
+        "unchanged": len(rows_by_key) - len(pending),
+    }
+
+def upsert_villagers(db: Session, villagers: Iterable[schemas.Villager]) -> dict[str, int]:
+    rows = (
+        {
+            "villager_id": villager.villager_id,
+            "name": villager.name,
+            "species": villager.species.value,
+            "personality": villager.personality.value,
+            "quote": villager.quote,
+        }
+        for villager in villagers
+    )
+    return bulk_upsert(db, models.Villager, "villager_id", rows)
+
+def upsert_gyroids(db: Session, gyroids: Iterable[schemas.Gyroid]) -> dict[str, int]:
+    rows = ({"gyroid_name": gyroid.name, "sound": gyroid.sound} for gyroid in gyroids)
+    return bulk_upsert(db, models.Gyroid, "gyroid_name", rows)
+
+# sorted in Python rather than with ORDER BY: database collations differ, and the catalog
+# order (see catalog.parse_villagers) must match the upstream parsers byte for byte
+def get_catalog_villagers(db: Session) -> tuple[CompactVillager, ...]:
+    villagers = sorted(db.exec(select(models.Villager)).all(), key=lambda villager: villager.villager_id)
+    return tuple(CompactVillager.from_model(schemas.Villager.model_validate(villager)) for villager in villagers)
+
+def get_catalog_gyroids(db: Session) -> tuple[CompactGyroid, ...]:
+    gyroids = sorted(db.exec(select(models.Gyroid)).all(), key=lambda gyroid: gyroid.gyroid_name)
+    return tuple(CompactGyroid(gyroid.gyroid_name, gyroid.sound) for gyroid in gyroids)
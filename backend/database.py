@@ -1,9 +1,48 @@
 from decouple import config
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlmodel import Session, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def to_async_url(url: str) -> str:
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername)).render_as_string(hide_password=False)
 
 DATABASE_URL = config("DATABASE_URL")
-engine = create_engine(DATABASE_URL)
+ASYNC_DATABASE_URL = config("ASYNC_DATABASE_URL", default=to_async_url(DATABASE_URL))
+DB_POOL_SIZE = config("DB_POOL_SIZE", default=5, cast=int)
+DB_MAX_OVERFLOW = config("DB_MAX_OVERFLOW", default=10, cast=int)
+DB_POOL_PRE_PING = config("DB_POOL_PRE_PING", default=True, cast=bool)
+DB_POOL_RECYCLE = config("DB_POOL_RECYCLE", default=1800, cast=int)
+
+def is_memory_sqlite(url: str) -> bool:
+    url = make_url(url)
+    database = url.database or ""
+    return url.get_backend_name() == "sqlite" and (
+        database in ("", ":memory:") or database.startswith("file::memory:") or url.query.get("mode") == "memory"
+    )
+
+def pool_options(url: str) -> dict:
+    options = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    # in-memory SQLite gets a SingletonThreadPool or StaticPool, which take no size arguments;
+    # file databases use a QueuePool like any other backend
+    if not is_memory_sqlite(url):
+        options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+    return options
+
+engine = create_engine(DATABASE_URL, **pool_options(DATABASE_URL))
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **pool_options(ASYNC_DATABASE_URL))
+async_session = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
 
 def get_db():
     with Session(engine) as session:
-        yield session
\ No newline at end of file
+        yield session
+
+async def get_async_db():
+    async with async_session() as session:
+        yield session
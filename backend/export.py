@@ -0,0 +1,49 @@
+from collections import defaultdict
+from decouple import config
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import crud
+
+from typing import AsyncIterator
+import json
+import zlib
+
+
+EXPORT_BATCH_SIZE = config("EXPORT_BATCH_SIZE", default=1000, cast=int)
+
+
+async def export_users_ndjson(db: AsyncSession, batch_size: int | None = None) -> AsyncIterator[bytes]:
+    """Stream every user and their island as one JSON line per user.
+
+    Users are read through a server-side cursor ``batch_size`` rows at a time
+    and each batch's links are fetched with one ``IN`` query per link table,
+    so memory stays bounded by the batch size, not the table size.
+    """
+    result = await db.stream(crud.export_users_query(batch_size or EXPORT_BATCH_SIZE))
+    async for users in result.partitions():
+        user_ids = [user.user_id for user in users]
+        villagers = defaultdict(list)
+        for user_id, villager_id in (await db.exec(crud.island_villagers_query(user_ids))).all():
+            villagers[user_id].append(villager_id)
+        gyroids = defaultdict(list)
+        for user_id, gyroid_name in (await db.exec(crud.island_gyroids_query(user_ids))).all():
+            gyroids[user_id].append(gyroid_name)
+
+        yield "".join(
+            json.dumps({
+                "user_id": user.user_id,
+                "username": user.username,
+                "native_fruit": user.native_fruit,
+                "villagers": sorted(villagers[user.user_id]),
+                "gyroids": sorted(gyroids[user.user_id]),
+            }) + "\n"
+            for user in users
+        ).encode()
+
+async def gzip_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,49 @@
+from decouple import config
+from fastapi import Request, Response
+
+import hashlib
+
+
+CATALOG_MAX_AGE = config("CATALOG_MAX_AGE", default=300, cast=int)
+CATALOG_STALE_WHILE_REVALIDATE = config("CATALOG_STALE_WHILE_REVALIDATE", default=3600, cast=int)
+STATIC_MAX_AGE = config("STATIC_MAX_AGE", default=86400, cast=int)
+
+
+def make_etag(*parts: object) -> str:
+    """Weak ETag over ``parts``.
+
+    Weak because the compression middleware may gzip or brotli the body after
+    the ETag is set, and a strong validator has to differ between
+    content-codings. Weak tags still revalidate with If-None-Match.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(str(part).encode())
+        digest.update(b"\x1f")
+    return f'W/"{digest.hexdigest()}"'
+
+def cache_control(max_age: int, stale_while_revalidate: int = 0) -> str:
+    value = f"public, max-age={max_age}"
+    if stale_while_revalidate:
+        value += f", stale-while-revalidate={stale_while_revalidate}"
+    return value
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    # If-None-Match uses the weak comparison
+    candidates = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+def not_modified(request: Request, response: Response, etag: str, max_age: int, stale_while_revalidate: int = 0) -> Response | None:
+    """Set validator headers on ``response``; return a 304 if the client's copy is current."""
+    headers = {"ETag": etag, "Cache-Control": cache_control(max_age, stale_while_revalidate)}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+def json_response(body: bytes, response: Response) -> Response:
+    """Send already-encoded JSON with the headers set on the injected ``response``."""
+    return Response(body, media_type="application/json", headers=response.headers)
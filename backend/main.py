@@ -1,20 +1,45 @@
-from fastapi import Depends, FastAPI, HTTPException
-from sqlmodel import Session, select
-
-from database import get_db
+from fastapi import Body, Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+import orjson
+
+from database import async_engine, engine, get_async_db
 from dotenv import load_dotenv
+from catalog import CatalogCache, CatalogEntry
+from export import export_users_ndjson, gzip_stream
+from search import SearchIndex, search_database
+from shared import SharedCatalog
+from snapshot import CATALOG_SNAPSHOT_PATH, start_from_snapshot
+from sync import CatalogSync
+from upstream import UpstreamClient, UpstreamError
+import analytics
+import crud
+import http_cache
+import metrics
 import models
 import schemas
 
+from contextlib import asynccontextmanager
+from typing import Literal
+import base64
+import binascii
+import json
+import math
 import os
-import requests
 
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
 
-load_dotenv()
 
-app = FastAPI()
+load_dotenv()
 
-base_url = "https://api.nookipedia.com"
+base_url = os.getenv("NOOKIPEDIA_URL", "https://api.nookipedia.com")
 
 def get_api_key():
     return os.getenv("API_KEY")
@@ -26,220 +51,371 @@ headers: dict[str, str] = {
     "Accepted-Version": "1.0.0"
 }
 
-
-villagers: list[models.Villager] = []
-gyroids: list[models.Gyroid] = []
-users: list[models.Users] = []
+NATIVE_FRUITS = ["Apple", "Cherry", "Orange", "Pear", "Peach"]
+NATIVE_FRUITS_ETAG = http_cache.make_etag("fruit", *NATIVE_FRUITS)
+NATIVE_FRUITS_BODY = orjson.dumps(NATIVE_FRUITS)
+COMPRESSION_MINIMUM_SIZE = 1024
+
+USERS_PAGE_SIZE = 100
+USERS_MAX_PAGE_SIZE = 1000
+
+upstream_client = UpstreamClient(base_url, headers)
+catalog_cache = CatalogCache(upstream_client)
+catalog_sync = CatalogSync(catalog_cache, engine)
+shared_catalog = SharedCatalog(catalog_cache)
+search_index = SearchIndex()
+catalog_cache.subscribe(search_index.on_catalog_change)
+catalog_cache.set_fallback(catalog_sync.read_resource)
+metrics.instrument_engines()
+metrics.registry.register(metrics.CatalogCacheCollector(catalog_cache))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await upstream_client.start()
+    if CATALOG_SNAPSHOT_PATH:
+        start_from_snapshot(catalog_cache, CATALOG_SNAPSHOT_PATH)
+    await shared_catalog.start()
+    await catalog_sync.start()
+    yield
+    await catalog_sync.stop()
+    await shared_catalog.stop()
+    await upstream_client.close()
+    await async_engine.dispose()
+
+app = FastAPI(lifespan=lifespan)
+if BrotliMiddleware is not None:
+    app.add_middleware(BrotliMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE)
+app.add_middleware(metrics.MetricsMiddleware)
+
+@app.exception_handler(UpstreamError)
+async def upstream_error_handler(request: Request, exc: UpstreamError):
+    headers = {"Retry-After": str(math.ceil(exc.retry_after))} if exc.retry_after is not None else None
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail}, headers=headers)
+
+
+def encode_cursor(user_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"after": user_id}).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        after = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))["after"]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(after, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return after
+
+def parse_expand(expand: str | None) -> tuple[str, ...]:
+    if not expand:
+        return ()
+    names = tuple(dict.fromkeys(name.strip() for name in expand.split(",") if name.strip()))
+    unknown = [name for name in names if name not in crud.USER_RELATIONSHIPS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Cannot expand {', '.join(unknown)}")
+    return names
+
+def to_user_profile(user: models.Users, expand: tuple[str, ...] = ("villagers", "gyroids")) -> schemas.UserProfile:
+    profile = schemas.UserProfile(user_id=user.user_id, username=user.username, native_fruit=user.native_fruit)
+    if "villagers" in expand:
+        profile.villagers = [schemas.Villager.model_validate(villager) for villager in user.villagers]
+    if "gyroids" in expand:
+        profile.gyroids = [schemas.Gyroid(name=gyroid.gyroid_name, sound=gyroid.sound) for gyroid in user.gyroids]
+    return profile
+
+async def conditional_catalog(request: Request, response: Response, resource: str, *variant) -> CatalogEntry | Response:
+    """Return the catalog entry, or a 304 when the client already holds this version.
+
+    A matching If-None-Match is answered from whatever version is cached, so
+    revalidations never wait on upstream.
+    """
+    cached = catalog_cache.peek(resource)
+    if cached is not None and http_cache.etag_matches(request, http_cache.make_etag(resource, cached.digest, *variant)):
+        catalog_cache.revalidate_if_stale(resource)
+        entry = cached
+    else:
+        entry = await catalog_cache.get(resource)
+    etag = http_cache.make_etag(resource, entry.digest, *variant)
+    return http_cache.not_modified(
+        request, response, etag, http_cache.CATALOG_MAX_AGE, http_cache.CATALOG_STALE_WHILE_REVALIDATE
+    ) or entry
 
 # GET
 @app.get("/villagers")
-async def get_villagers(species: schemas.Species, personality: schemas.Personality = None) -> list[schemas.Villager]:
-    response = requests.get(f"{base_url}/villagers", headers=headers)
-    if response.status_code != 200:
-        raise HTTPException(status_code=response.status_code, detail="Failed to fetch villagers from API")
-    r_json = response.json()
-
-    filtered_villagers = []
-
-    for villager_json in r_json:
-        villager = schemas.Villager(
-            villager_id=villager_json["id"],
-            name=villager_json["name"],
-            species=villager_json["species"].lower(),
-            personality=villager_json["personality"].lower(),
-            quote=villager_json["quote"]
-        )
-        if villager.species == species:
-            if personality is None or villager.personality == personality:
-                filtered_villagers.append(villager)
-
-    return filtered_villagers
+async def get_villagers(request: Request, response: Response, species: list[schemas.Species] = Query(), personality: list[schemas.Personality] = Query(None)) -> list[schemas.Villager]:
+    personality = personality or []
+    variant = (tuple(sorted({s.value for s in species})), tuple(sorted({p.value for p in personality})))
+    entry = await conditional_catalog(request, response, "villagers", *variant)
+    if isinstance(entry, Response):
+        return entry
+    body = entry.body(variant, lambda: entry.index.lookup(species, personality))
+    return http_cache.json_response(body, response)
 
 @app.get("/gyroids")
-async def get_gyroids(db: Session = Depends(get_db)) -> list[schemas.Gyroid]:
-    response = requests.get(f"{base_url}/nh/gyroids", headers=headers)
-    if response.status_code != 200:
-        raise HTTPException(status_code=response.status_code, detail="Failed to fetch gyroids from API")
-    r_json = response.json()
-    print(response)
-
-    for gyroid_json in r_json:
-        gyroid = schemas.Gyroid(
-        name=gyroid_json["name"], 
-        sound=gyroid_json["sound"],
-        )
-        gyroids.append(gyroid)
-    
-    return gyroids
+async def get_gyroids(request: Request, response: Response) -> list[schemas.Gyroid]:
+    entry = await conditional_catalog(request, response, "gyroids")
+    if isinstance(entry, Response):
+        return entry
+    return http_cache.json_response(entry.body((), lambda: entry.items), response)
 
 @app.get("/fruit")
-async def get_fruit() -> list[str]:
-    native_fruits = ["Apple", "Cherry", "Orange", "Pear", "Peach"]
-    return native_fruits
+async def get_fruit(request: Request, response: Response) -> list[str]:
+    not_modified = http_cache.not_modified(request, response, NATIVE_FRUITS_ETAG, http_cache.STATIC_MAX_AGE)
+    if not_modified:
+        return not_modified
+    return http_cache.json_response(NATIVE_FRUITS_BODY, response)
+
+@app.get("/search")
+async def search_catalog(
+    q: str = Query(min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    kind: list[Literal["villager", "gyroid"]] = Query(None),
+    source: Literal["memory", "database"] = "memory",
+    db: AsyncSession = Depends(get_async_db),
+) -> list[schemas.SearchResult]:
+    if source == "database":
+        return await search_database(db, q, limit=limit, kinds=kind)
+
+    for resource, resource_kind in (("villagers", "villager"), ("gyroids", "gyroid")):
+        if not kind or resource_kind in kind:
+            await catalog_cache.get(resource)
+    return search_index.search(q, limit=limit, kinds=kind)
+
+@app.get("/catalog/stats")
+async def get_catalog_stats() -> dict[str, dict]:
+    return {**catalog_cache.stats(), "sync": catalog_sync.stats(), "shared": shared_catalog.stats(), "upstream": upstream_client.stats()}
+
+@app.get("/stats/species")
+async def get_species_stats(db: AsyncSession = Depends(get_async_db)) -> list[schemas.PopulationShare]:
+    return await analytics.villager_distribution(db, "species")
+
+@app.get("/stats/personalities")
+async def get_personality_stats(db: AsyncSession = Depends(get_async_db)) -> list[schemas.PopulationShare]:
+    return await analytics.villager_distribution(db, "personality")
+
+@app.get("/stats/villagers")
+async def get_popular_villagers(limit: int = Query(10, ge=1, le=100), db: AsyncSession = Depends(get_async_db)) -> list[schemas.PopularItem]:
+    return await analytics.popular_villagers(db, limit)
+
+@app.get("/stats/gyroids")
+async def get_popular_gyroids(limit: int = Query(10, ge=1, le=100), db: AsyncSession = Depends(get_async_db)) -> list[schemas.PopularItem]:
+    return await analytics.popular_gyroids(db, limit)
+
+@app.get("/stats/fruit")
+async def get_native_fruit_stats(db: AsyncSession = Depends(get_async_db)) -> list[schemas.PopulationShare]:
+    return await analytics.native_fruit_shares(db)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics() -> Response:
+    body, media_type = metrics.render()
+    return Response(body, media_type=media_type)
+
+@app.get("/users", response_model_exclude_none=True)
+async def get_users(
+    response: Response,
+    limit: int = Query(USERS_PAGE_SIZE, ge=1, le=USERS_MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    native_fruit: str | None = None,
+    expand: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+) -> list[schemas.UserProfile]:
+    after = decode_cursor(cursor) if cursor else None
+    expand = parse_expand(expand)
+    users = (await db.exec(crud.users_page_query(limit + 1, after=after, native_fruit=native_fruit, expand=expand))).all()
+    if len(users) > limit:
+        users = users[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(users[-1].user_id)
+    return [to_user_profile(user, expand) for user in users]
+
+@app.get("/users/{user_id}")
+async def get_user(user_id: int, db: AsyncSession = Depends(get_async_db)) -> schemas.UserProfile:
+    user = (await db.exec(crud.user_profile_query(user_id))).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return to_user_profile(user)
 
-@app.get("/users")
-async def get_users(db: Session = Depends(get_db)) -> list[models.Users]:
-    return db.exec(select(models.Users)).all()
+@app.get("/export/users")
+async def export_users(request: Request, db: AsyncSession = Depends(get_async_db)) -> StreamingResponse:
+    body = export_users_ndjson(db)
+    headers = {}
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        body = gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type="application/x-ndjson", headers=headers)
 
 # POST
 @app.post("/users")
-async def create_user(user: models.Users, db: Session = Depends(get_db)):
+async def create_user(user: models.Users, db: AsyncSession = Depends(get_async_db)):
     db.add(user)
-    db.commit()
+    await analytics.bump(db, "fruit", {user.native_fruit: 1})
+    await db.commit()
     return{"message": "User created successfully"}
 
 @app.post("/users/{user_id}/villagers/{villager_id}")
-async def add_villager_to_user(user_id: int, villager_id: str, db: Session = Depends(get_db)):
-    user = db.get(models.Users, user_id)
+async def add_villager_to_user(user_id: int, villager_id: str, db: AsyncSession = Depends(get_async_db)):
+    user = await db.get(models.Users, user_id, options=[selectinload(models.Users.villagers)])
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    villager = db.exec(select(models.Villager).where(models.Villager.villager_id == villager_id)).first()
+    villager = (await db.exec(select(models.Villager).where(models.Villager.villager_id == villager_id))).first()
     if not villager:
         raise HTTPException(status_code=404, detail="Villager not found")
     
     user.villagers.append(villager)
+    await analytics.bump(db, "villagers", {villager.villager_id: 1})
 
-    db.commit()
+    await db.commit()
 
     return{"message": f"Villager '{villager.name}' added to user '{user.username}' successfully"}
 
-@app.post("/add_villagers")
-async def add_villagers_to_database(db: Session = Depends(get_db)):
-    response = requests.get(f"{base_url}/villagers", headers=headers)
-    r_json = response.json()
-
-    for villager_json in r_json:
-        villager = schemas.Villager(
-            villager_id=villager_json["id"],
-            name=villager_json["name"],
-            species=villager_json["species"].lower(),
-            personality=villager_json["personality"].lower(),
-            quote=villager_json["quote"]
-        )
-
-        existing_villager = db.exec(select(models.Villager).where(models.Villager.villager_id == villager.villager_id)).first()
-        if existing_villager:
-            continue 
-
-        villager_model = models.Villager(
-            villager_id=villager.villager_id,
-            name=villager.name,
-            species=villager.species,
-            personality=villager.personality,
-            quote=villager.quote
-        )
-        db.add(villager_model)
-
-    db.commit()
-
-    return {"message": "Villagers added to database successfully"}
-
-@app.post("/add_gyroids")
-async def add_gyroids_to_database(db: Session = Depends(get_db)):
-    response = requests.get(f"{base_url}/nh/gyroids", headers=headers)
-    r_json = response.json()
+async def add_many_to_user(db: AsyncSession, user_id: int, model, key: str, link_model, counter: str, values: list[str]) -> dict:
+    user = await db.get(models.Users, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
 
-    for gyroid_json in r_json:
-        gyroid = schemas.Gyroid(
-            name=gyroid_json["name"],
-            sound=gyroid_json["sound"]
-        )
+    values = list(dict.fromkeys(values))
+    if not values:
+        return {"user": user, "results": {}, "added": 0}
+
+    column = getattr(model, key)
+    found = set((await db.exec(select(column).where(column.in_(values)))).all())
+    results = {value: "not_found" for value in values if value not in found}
+
+    to_link = [value for value in values if value in found]
+    added = set()
+    if to_link:
+        statement = crud.link_islands_statement(db.bind.dialect.name, link_model, key, user_id, to_link)
+        added = set((await db.exec(statement)).scalars().all())
+        await analytics.bump(db, counter, dict.fromkeys(added, 1))
+        await db.commit()
+    for value in to_link:
+        results[value] = "added" if value in added else "already_present"
+
+    return {"user": user, "results": {value: results[value] for value in values}, "added": len(added)}
+
+@app.post("/users/{user_id}/villagers")
+async def add_villagers_to_user(user_id: int, villager_ids: list[str] = Body(), db: AsyncSession = Depends(get_async_db)):
+    outcome = await add_many_to_user(db, user_id, models.Villager, "villager_id", models.UserVillagerLink, "villagers", villager_ids)
+    return {
+        "message": f"{outcome['added']} villagers added to user '{outcome['user'].username}'",
+        "results": outcome["results"],
+    }
+
+@app.post("/users/{user_id}/gyroids")
+async def add_gyroids_to_user(user_id: int, gyroid_names: list[str] = Body(), db: AsyncSession = Depends(get_async_db)):
+    outcome = await add_many_to_user(db, user_id, models.Gyroid, "gyroid_name", models.UserGyroidLink, "gyroids", gyroid_names)
+    return {
+        "message": f"{outcome['added']} gyroids added to user '{outcome['user'].username}'",
+        "results": outcome["results"],
+    }
 
-        existing_gyroid = db.exec(select(models.Gyroid).where(models.Gyroid.gyroid_name == gyroid.name)).first()
-        if existing_gyroid:
-            continue 
+@app.post("/add_villagers")
+async def add_villagers_to_database(db: AsyncSession = Depends(get_async_db)):
+    catalog_villagers = (await catalog_cache.refresh("villagers")).items
+    counts = await db.run_sync(crud.upsert_villagers, catalog_villagers)
+    await db.commit()
 
-        gyroid_model = models.Gyroid(
-            gyroid_name=gyroid.name,
-            sound=gyroid.sound
-        )
-        db.add(gyroid_model)
+    return {"message": "Villagers added to database successfully", **counts}
 
-    db.commit()
+@app.post("/add_gyroids")
+async def add_gyroids_to_database(db: AsyncSession = Depends(get_async_db)):
+    catalog_gyroids = (await catalog_cache.refresh("gyroids")).items
+    counts = await db.run_sync(crud.upsert_gyroids, catalog_gyroids)
+    await db.commit()
 
-    return {"message": "Gyroids added to database successfully"}
+    return {"message": "Gyroids added to database successfully", **counts}
 
 @app.post("/users/{user_id}/gyroids/{gyroid_name}")
-async def add_gyroid_to_user(user_id: int, gyroid_name: str, db: Session = Depends(get_db)):
-    user = db.get(models.Users, user_id)
+async def add_gyroid_to_user(user_id: int, gyroid_name: str, db: AsyncSession = Depends(get_async_db)):
+    user = await db.get(models.Users, user_id, options=[selectinload(models.Users.gyroids)])
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    gyroid = db.exec(select(models.Gyroid).where(models.Gyroid.gyroid_name == gyroid_name)).first()
+    gyroid = (await db.exec(select(models.Gyroid).where(models.Gyroid.gyroid_name == gyroid_name))).first()
     if not gyroid:
         raise HTTPException(status_code=404, detail="Villager not found")
     
     user.gyroids.append(gyroid)
+    await analytics.bump(db, "gyroids", {gyroid.gyroid_name: 1})
 
-    db.commit()
+    await db.commit()
 
     return{"message": f"Gyroid '{gyroid.gyroid_name}' added to user '{user.username}' successfully"}
 
 # PATCH
 @app.patch("/users/{user_id}")
-async def update_username(user_id: int, new_username: str, db: Session = Depends(get_db)):
-    user = db.get(models.Users, user_id)
+async def update_username(user_id: int, new_username: str, db: AsyncSession = Depends(get_async_db)):
+    user = await db.get(models.Users, user_id)
     if user:
         user.username = new_username
-        db.commit()
+        await db.commit()
         return{"message": "Username updated successfully"}
     else:
         return HTTPException(status_code=404, detail="User not found")
 
 @app.patch("/users/{user_id}/villagers/{old_villager_id}/switch/{new_villager_id}")
-async def update_user_villagers(user_id: int, old_villager_id: str, new_villager_id: str, db: Session = Depends(get_db)):
-    user = db.get(models.Users, user_id)
+async def update_user_villagers(user_id: int, old_villager_id: str, new_villager_id: str, db: AsyncSession = Depends(get_async_db)):
+    user = await db.get(models.Users, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    if old_villager_id == new_villager_id:
+        raise HTTPException(status_code=409, detail="Old and new villager are the same")
     
-    old_villager = db.exec(select(models.Villager).where(models.Villager.villager_id == old_villager_id)).first()
+    villagers = {
+        villager.villager_id: villager
+        for villager in (await db.exec(select(models.Villager).where(models.Villager.villager_id.in_([old_villager_id, new_villager_id])))).all()
+    }
+    old_villager = villagers.get(old_villager_id)
     if not old_villager:
         raise HTTPException(status_code=404, detail="Old villager not found")
     
-    new_villager = db.exec(select(models.Villager).where(models.Villager.villager_id == new_villager_id)).first()
+    new_villager = villagers.get(new_villager_id)
     if not new_villager:
         raise HTTPException(status_code=404, detail="New villager not found")
     
-    user.villagers = [villagers for villager in user.villagers if villager.villager_id != old_villager_id]
+    try:
+        result = await db.exec(crud.swap_villager_statement(user_id, old_villager_id, new_villager_id))
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="New villager already lives on this island")
+    if result.rowcount == 0:
+        raise HTTPException(status_code=404, detail="Old villager does not live on this island")
+    await analytics.bump(db, "villagers", {old_villager_id: -1, new_villager_id: 1})
 
-    user.villagers.append(new_villager)
-
-    db.commit()
+    await db.commit()
 
     return {"message": f"Villager '{old_villager.name}' switched to '{new_villager.name}' successfully"}
 
 # DELETE
 @app.delete("/users/{user_id}")
-async def delete_user(user_id: int, db: Session = Depends(get_db)):
-    user = db.get(models.Users, user_id)
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_async_db)):
+    user = await db.get(models.Users, user_id, options=[selectinload(models.Users.villagers), selectinload(models.Users.gyroids)])
     if user:
-        db.delete(user)
-        db.commit()
+        await analytics.bump(db, "villagers", {villager.villager_id: -1 for villager in user.villagers})
+        await analytics.bump(db, "gyroids", {gyroid.gyroid_name: -1 for gyroid in user.gyroids})
+        await analytics.bump(db, "fruit", {user.native_fruit: -1})
+        await db.delete(user)
+        await db.commit()
         return {"message": "User deleted successfully"}
     else:
         raise HTTPException(status_code=404, detail="User not found")
 
 @app.delete("/users/{user_id}/villagers/{villager_id}")
-async def delete_villager_from_user(user_id: int, villager_id: str, db: Session = Depends(get_db)):
-    user = db.get(models.Users, user_id)
+async def delete_villager_from_user(user_id: int, villager_id: str, db: AsyncSession = Depends(get_async_db)):
+    user = await db.get(models.Users, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    villager = db.exec(select(models.Villager).where(models.Villager.villager_id == villager_id)).first()
+    villager = (await db.exec(select(models.Villager).where(models.Villager.villager_id == villager_id))).first()
     if not villager:
         raise HTTPException(status_code=404, detail="Villager not found")
     
-    index_to_remove = None
-    for i, villager in enumerate(user.villagers):
-        if villager.villager_id == villager_id:
-            index_to_remove = i
-            break
-
-    if index_to_remove is not None:
-        del user.villagers[index_to_remove]
+    result = await db.exec(crud.remove_villager_statement(user_id, villager_id))
+    if result.rowcount == 0:
+        raise HTTPException(status_code=404, detail="Villager does not live on this island")
+    await analytics.bump(db, "villagers", {villager_id: -1})
 
-    db.delete(villager)
-    db.commit()
+    await db.commit()
     
     return {"message": f"Villager '{villager.name}' deleted from user {user.username}' successfully"}
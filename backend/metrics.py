@@ -0,0 +1,153 @@
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.process_collector import ProcessCollector
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from contextvars import ContextVar
+from dataclasses import dataclass
+import time
+
+
+registry = CollectorRegistry()
+ProcessCollector(registry=registry)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling a request, by route template.",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+    registry=registry,
+)
+UPSTREAM_LATENCY = Histogram(
+    "upstream_request_duration_seconds",
+    "Time spent on each Nookipedia call attempt.",
+    ["path", "status"],
+    buckets=LATENCY_BUCKETS,
+    registry=registry,
+)
+DB_STATEMENTS = Counter(
+    "db_statements_total",
+    "SQL statements executed.",
+    registry=registry,
+)
+DB_STATEMENT_LATENCY = Histogram(
+    "db_statement_duration_seconds",
+    "Time spent executing a single SQL statement.",
+    buckets=LATENCY_BUCKETS,
+    registry=registry,
+)
+DB_STATEMENTS_PER_REQUEST = Histogram(
+    "http_request_db_statements",
+    "SQL statements executed while handling a request.",
+    ["route"],
+    buckets=STATEMENT_BUCKETS,
+    registry=registry,
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "http_request_db_duration_seconds",
+    "Time spent in SQL statements while handling a request.",
+    ["route"],
+    buckets=LATENCY_BUCKETS,
+    registry=registry,
+)
+
+
+@dataclass
+class RequestStats:
+    statements: int = 0
+    db_seconds: float = 0.0
+
+
+_request_stats: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    DB_STATEMENTS.inc()
+    DB_STATEMENT_LATENCY.observe(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.db_seconds += elapsed
+
+def instrument_engines():
+    """Time every statement on every engine, sync or async, including ones created later."""
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def observe_upstream(path: str, status: int | str, seconds: float):
+    UPSTREAM_LATENCY.labels(path, str(status)).observe(seconds)
+
+
+class CatalogCacheCollector:
+    """Exports catalog cache counters at scrape time, so lookups pay nothing extra."""
+
+    def __init__(self, catalog_cache):
+        self.catalog_cache = catalog_cache
+
+    def collect(self):
+        lookups = CounterMetricFamily("catalog_cache_lookups", "Catalog cache lookups by result.", labels=["resource", "result"])
+        upstream = CounterMetricFamily("catalog_cache_upstream", "Catalog upstream fetches by outcome.", labels=["resource", "outcome"])
+        hit_ratio = GaugeMetricFamily("catalog_cache_hit_ratio", "Share of catalog lookups served from memory.", labels=["resource"])
+        size = GaugeMetricFamily("catalog_cache_size", "Records held for each catalog.", labels=["resource"])
+        age = GaugeMetricFamily("catalog_cache_age_seconds", "Seconds since the catalog was last fetched or revalidated.", labels=["resource"])
+        for resource, stats in self.catalog_cache.stats().items():
+            for result in ("hits", "stale_hits", "misses", "fallbacks"):
+                lookups.add_metric([resource, result], stats[result])
+            for outcome in ("revalidations", "refreshes", "errors", "coalesced"):
+                upstream.add_metric([resource, outcome], stats[outcome])
+            if stats["hit_ratio"] is not None:
+                hit_ratio.add_metric([resource], stats["hit_ratio"])
+            size.add_metric([resource], stats["size"])
+            if stats["age_seconds"] is not None:
+                age.add_metric([resource], stats["age_seconds"])
+        circuit = GaugeMetricFamily("upstream_circuit_open", "1 while the upstream circuit breaker is open or probing.")
+        circuit.add_metric([], int(self.catalog_cache.upstream_client.breaker.state != "closed"))
+        return [lookups, upstream, hit_ratio, size, age, circuit]
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware recording latency and DB usage per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_stats.reset(token)
+            route = scope.get("route")
+            route = route.path if route is not None else "unmatched"
+            REQUEST_LATENCY.labels(scope["method"], route, str(status)).observe(elapsed)
+            DB_STATEMENTS_PER_REQUEST.labels(route).observe(stats.statements)
+            DB_TIME_PER_REQUEST.labels(route).observe(stats.db_seconds)
+
+
+def render() -> tuple[bytes, str]:
+    return generate_latest(registry), CONTENT_TYPE_LATEST
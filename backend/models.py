@@ -1,11 +1,16 @@
+from sqlalchemy import Index
 from sqlmodel import Field, Relationship, SQLModel
 
 
 class UserVillagerLink(SQLModel, table=True):
+    __table_args__ = (Index("ix_uservillagerlink_villager_id", "villager_id"),)
+
     user_id: int = Field(foreign_key="users.user_id", primary_key=True)
     villager_id: str = Field(foreign_key="villager.villager_id", primary_key=True)
 
 class Villager(SQLModel, table=True):
+    __table_args__ = (Index("ix_villager_species_personality", "species", "personality"),)
+
     villager_id: str = Field(primary_key=True)
     name: str
     species: str
@@ -14,6 +19,8 @@ class Villager(SQLModel, table=True):
     users: list["Users"] = Relationship(back_populates="villagers", link_model=UserVillagerLink)
 
 class UserGyroidLink(SQLModel, table=True):
+    __table_args__ = (Index("ix_usergyroidlink_gyroid_name", "gyroid_name"),)
+
     user_id: int = Field(foreign_key="users.user_id", primary_key=True)
     gyroid_name: str = Field(foreign_key="gyroid.gyroid_name", primary_key=True)
 
@@ -27,4 +34,16 @@ class Users(SQLModel, table=True):
     username: str
     native_fruit: str
     gyroids: list[Gyroid] = Relationship(back_populates="users", link_model=UserGyroidLink)
-    villagers: list[Villager] = Relationship(back_populates="users", link_model=UserVillagerLink)
\ No newline at end of file
+    villagers: list[Villager] = Relationship(back_populates="users", link_model=UserVillagerLink)
+
+class VillagerIslandCount(SQLModel, table=True):
+    villager_id: str = Field(foreign_key="villager.villager_id", primary_key=True)
+    islands: int = 0
+
+class GyroidIslandCount(SQLModel, table=True):
+    gyroid_name: str = Field(foreign_key="gyroid.gyroid_name", primary_key=True)
+    islands: int = 0
+
+class NativeFruitCount(SQLModel, table=True):
+    native_fruit: str = Field(primary_key=True)
+    users: int = 0
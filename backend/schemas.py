@@ -42,9 +42,6 @@ class Species(str, Enum):
     TIGER = "tiger"
     WOLF = "wolf"
 
-    class Config:
-        from_attributes = True
-
 class Personality(str, Enum):
     BIG_SISTER = "big sister"
     CRANKY = "cranky"
@@ -70,6 +67,29 @@ class Gyroid(BaseModel):
     name: str
     sound: str
 
+class UserProfile(BaseModel):
+    user_id: int
+    username: str
+    native_fruit: str
+    villagers: list[Villager] | None = None
+    gyroids: list[Gyroid] | None = None
+
+class SearchResult(BaseModel):
+    kind: str
+    id: str
+    name: str
+    score: float
+
+class PopulationShare(BaseModel):
+    key: str
+    count: int
+    share: float
+
+class PopularItem(BaseModel):
+    id: str
+    name: str
+    islands: int
+
 class UserCreate(BaseModel):
     username: str
     native_fruit: str
@@ -0,0 +1,179 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from sqlalchemy import text
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+import schemas
+
+from typing import Iterable
+import heapq
+import json
+import re
+import unicodedata
+
+
+SEARCH_MAX_PREFIX = 24
+NAME_WEIGHT = 3.0
+TEXT_WEIGHT = 1.0
+EXACT_WORD_BONUS = 2.0
+NAME_PREFIX_BONUS = 5.0
+
+WORD = re.compile(r"\w+")
+
+
+def tokenize(value: str) -> list[str]:
+    value = unicodedata.normalize("NFKD", value.lower())
+    return WORD.findall("".join(char for char in value if not unicodedata.combining(char)))
+
+
+@dataclass(frozen=True)
+class SearchDocument:
+    kind: str
+    key: str
+    name: str
+    text: str
+
+
+def villager_documents(villagers: Iterable[schemas.Villager]) -> list[SearchDocument]:
+    return [SearchDocument("villager", villager.villager_id, villager.name, villager.quote) for villager in villagers]
+
+def gyroid_documents(gyroids: Iterable[schemas.Gyroid]) -> list[SearchDocument]:
+    return [SearchDocument("gyroid", gyroid.name, gyroid.name, gyroid.sound) for gyroid in gyroids]
+
+DOCUMENT_BUILDERS = {
+    "villagers": ("villager", villager_documents),
+    "gyroids": ("gyroid", gyroid_documents),
+}
+
+
+class SearchIndex:
+    """In-memory prefix index over catalog names, quotes and sounds.
+
+    Every prefix of every token maps to the documents containing it with a
+    field-weighted score, so a prefix query is one dict lookup per query word
+    followed by an intersection. Updates diff the incoming documents against
+    the indexed ones and only touch the postings of changed documents.
+    """
+
+    def __init__(self):
+        self._documents: dict[tuple[str, str], SearchDocument] = {}
+        self._postings: dict[str, dict[tuple[str, str], float]] = defaultdict(dict)
+        self._document_prefixes: dict[tuple[str, str], tuple[str, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def clear(self):
+        self._documents.clear()
+        self._postings.clear()
+        self._document_prefixes.clear()
+
+    def on_catalog_change(self, resource: str, items: tuple):
+        if resource in DOCUMENT_BUILDERS:
+            kind, builder = DOCUMENT_BUILDERS[resource]
+            self.update(kind, builder(items))
+
+    def update(self, kind: str, documents: Iterable[SearchDocument]) -> dict[str, int]:
+        incoming = {(document.kind, document.key): document for document in documents}
+        current = {doc_id for doc_id in self._documents if doc_id[0] == kind}
+
+        removed = [doc_id for doc_id in current if doc_id not in incoming]
+        changed = [doc_id for doc_id, document in incoming.items() if self._documents.get(doc_id) != document]
+        for doc_id in removed:
+            self._remove(doc_id)
+        for doc_id in changed:
+            if doc_id in self._documents:
+                self._remove(doc_id)
+            self._add(doc_id, incoming[doc_id])
+        return {"indexed": len(changed), "removed": len(removed)}
+
+    def _add(self, doc_id: tuple[str, str], document: SearchDocument):
+        scores: dict[str, float] = {}
+        for value, weight in ((document.name, NAME_WEIGHT), (document.text, TEXT_WEIGHT)):
+            for token in tokenize(value):
+                for length in range(1, min(len(token), SEARCH_MAX_PREFIX) + 1):
+                    score = weight * (EXACT_WORD_BONUS if length == len(token) else 1.0)
+                    prefix = token[:length]
+                    if score > scores.get(prefix, 0.0):
+                        scores[prefix] = score
+        for prefix, score in scores.items():
+            self._postings[prefix][doc_id] = score
+        self._documents[doc_id] = document
+        self._document_prefixes[doc_id] = tuple(scores)
+
+    def _remove(self, doc_id: tuple[str, str]):
+        for prefix in self._document_prefixes.pop(doc_id):
+            postings = self._postings[prefix]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[prefix]
+        del self._documents[doc_id]
+
+    def search(self, query: str, limit: int = 20, kinds: Iterable[str] | None = None) -> list[schemas.SearchResult]:
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        postings = [self._postings.get(token[:SEARCH_MAX_PREFIX]) for token in tokens]
+        if not all(postings):
+            return []
+        postings.sort(key=len)
+
+        kinds = set(kinds) if kinds else None
+        scores = {doc_id: score for doc_id, score in postings[0].items() if kinds is None or doc_id[0] in kinds}
+        for other in postings[1:]:
+            scores = {doc_id: score + other[doc_id] for doc_id, score in scores.items() if doc_id in other}
+
+        phrase = " ".join(tokens)
+        ranked = []
+        for doc_id, score in scores.items():
+            document = self._documents[doc_id]
+            if " ".join(tokenize(document.name)).startswith(phrase):
+                score += NAME_PREFIX_BONUS
+            ranked.append((score, document))
+
+        best = heapq.nsmallest(limit, ranked, key=lambda result: (-result[0], result[1].name.lower(), result[1].kind))
+        return [
+            schemas.SearchResult(kind=document.kind, id=document.key, name=document.name, score=round(score, 3))
+            for score, document in best
+        ]
+
+
+async def search_database(db: AsyncSession, query: str, limit: int = 20, kinds: Iterable[str] | None = None) -> list[schemas.SearchResult]:
+    """Prefix search over the persisted catalog tables.
+
+    Uses the ``catalog_search`` FTS5 table on SQLite and the ``to_tsvector``
+    expression indexes on PostgreSQL, both created by migration a3f5c8e1d2b6.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    kinds = list(kinds) if kinds else ["villager", "gyroid"]
+    dialect = db.bind.dialect.name
+
+    if dialect == "sqlite":
+        statement = text(
+            "SELECT kind, key, name, -bm25(catalog_search, 0.0, 0.0, :name_weight, :text_weight) AS score "
+            "FROM catalog_search WHERE catalog_search MATCH :match AND kind IN (SELECT value FROM json_each(:kinds)) "
+            "ORDER BY score DESC, name LIMIT :limit"
+        )
+        params = {"match": " ".join(f'"{token}"*' for token in tokens)}
+    elif dialect == "postgresql":
+        statement = text(
+            "SELECT kind, key, name, score FROM ("
+            " SELECT 'villager' AS kind, villager_id AS key, name,"
+            "  ts_rank(to_tsvector('simple', name || ' ' || quote), to_tsquery('simple', :match)) AS score"
+            "  FROM villager WHERE to_tsvector('simple', name || ' ' || quote) @@ to_tsquery('simple', :match)"
+            " UNION ALL"
+            " SELECT 'gyroid' AS kind, gyroid_name AS key, gyroid_name AS name,"
+            "  ts_rank(to_tsvector('simple', gyroid_name || ' ' || sound), to_tsquery('simple', :match)) AS score"
+            "  FROM gyroid WHERE to_tsvector('simple', gyroid_name || ' ' || sound) @@ to_tsquery('simple', :match)"
+            ") AS matches WHERE kind IN (SELECT json_array_elements_text(CAST(:kinds AS json))) "
+            "ORDER BY score DESC, name LIMIT :limit"
+        )
+        params = {"match": " & ".join(f"{token}:*" for token in tokens)}
+    else:
+        raise NotImplementedError(f"Database search is not supported for {dialect}")
+
+    params.update(kinds=json.dumps(kinds), limit=limit, name_weight=NAME_WEIGHT, text_weight=TEXT_WEIGHT)
+    rows = (await db.exec(statement, params=params)).all()
+    return [schemas.SearchResult(kind=kind, id=key, name=name, score=round(float(score), 3)) for kind, key, name, score in rows]
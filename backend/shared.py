@@ -0,0 +1,130 @@
+"""Catalog cache shared by the workers of one host.
+
+With CATALOG_SHARED_PATH set, one worker per host holds a ``SyncLock`` on
+``<path>.lock`` and is the only one that refreshes the catalog from
+Nookipedia. After each refresh it publishes the catalog to ``<path>`` in the
+snapshot format, stamped with its publication time and renamed into place,
+so readers always map one complete version. Every worker polls the file and
+loads a newer stamp into its own ``CatalogCache``. Followers' caches are
+put in follower mode, so they never call upstream from a request: when the
+leader's refresh fails they keep serving what they have until it publishes
+again. If the leader dies the OS drops its lock and another worker takes
+over on its next tick.
+"""
+from decouple import config
+
+from catalog import CATALOG_RESOURCES, CatalogCache
+from snapshot import SnapshotError, apply_snapshot, read_snapshot, write_snapshot
+from sync import SyncLock
+from upstream import UpstreamError
+
+import asyncio
+import logging
+import os
+import time
+
+
+CATALOG_SHARED_PATH = config("CATALOG_SHARED_PATH", default="")
+CATALOG_SHARED_INTERVAL = config("CATALOG_SHARED_INTERVAL", default=1.0, cast=float)
+
+logger = logging.getLogger(__name__)
+
+
+class SharedCatalog:
+    def __init__(self, catalog_cache: CatalogCache, path: str = CATALOG_SHARED_PATH, interval: float = CATALOG_SHARED_INTERVAL, lock: SyncLock | None = None):
+        self.catalog_cache = catalog_cache
+        self.path = path
+        self.interval = interval
+        self.lock = lock or SyncLock(None, path=f"{path}.lock")
+        self._task: asyncio.Task | None = None
+        self._file_id: tuple | None = None
+        self._published: dict[str, float] = {}
+        self.stamp: float | None = None
+        self.loads = 0
+        self.publishes = 0
+
+    async def start(self):
+        if self.path and self._task is None:
+            await self.run_once()
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.lock.release()
+        self.catalog_cache.follower = False
+
+    async def _run_forever(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Shared catalog update failed")
+
+    async def run_once(self):
+        self._load_if_newer()
+        leader = self.lock.acquire()
+        self.catalog_cache.follower = not leader
+        if leader:
+            await self._refresh_and_publish()
+
+    def _file_identity(self) -> tuple | None:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _load_if_newer(self):
+        # a stat per tick; the file is only mapped and parsed when it was replaced
+        file_id = self._file_identity()
+        if file_id is None or file_id == self._file_id:
+            return
+        try:
+            stored = read_snapshot(self.path)
+            self._file_id = file_id
+            if self.stamp is not None and stored["created_at"] <= self.stamp:
+                return
+            loaded = apply_snapshot(self.catalog_cache, stored)
+        except (OSError, SnapshotError):
+            logger.exception("Could not load shared catalog %s", self.path)
+            return
+        self._published = {resource: self.catalog_cache.peek(resource).fetched_at for resource in loaded}
+        self.stamp = stored["created_at"]
+        self.loads += 1
+
+    async def _refresh_and_publish(self):
+        # refresh a couple of ticks early, so followers get the new version before theirs expires
+        refresh_age = self.catalog_cache.ttl - 2 * self.interval
+        for resource in CATALOG_RESOURCES:
+            entry = self.catalog_cache.peek(resource)
+            if entry is None or entry.age >= refresh_age:
+                try:
+                    await self.catalog_cache.refresh(resource)
+                except UpstreamError as exc:
+                    logger.warning("Shared catalog refresh of %s failed: %s", resource, exc.detail)
+
+        fetched = {resource: entry.fetched_at for resource in CATALOG_RESOURCES if (entry := self.catalog_cache.peek(resource))}
+        if fetched and fetched != self._published:
+            stamp = time.time()
+            await asyncio.to_thread(write_snapshot, self.catalog_cache, self.path, stamp)
+            self._file_id = self._file_identity()
+            self._published = fetched
+            self.stamp = stamp
+            self.publishes += 1
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path or None,
+            "leader": self.lock.held,
+            "follower": self.catalog_cache.follower,
+            "stamp": self.stamp,
+            "loads": self.loads,
+            "publishes": self.publishes,
+        }
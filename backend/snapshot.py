@@ -0,0 +1,165 @@
+"""Versioned on-disk snapshots of the catalog.
+
+A snapshot lets a worker start serving /villagers and /gyroids straight
+away, even with Nookipedia unreachable. Write one from the backend folder:
+
+    python -m snapshot write catalog.snapshot
+    python -m snapshot info catalog.snapshot
+
+and start the API with CATALOG_SNAPSHOT_PATH=catalog.snapshot.
+"""
+from decouple import config
+from pydantic import ValidationError
+import msgpack
+
+from catalog import CATALOG_RESOURCES, CatalogCache
+from compact import CompactGyroid, CompactVillager
+import schemas
+
+import argparse
+import asyncio
+import logging
+import math
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+
+CATALOG_SNAPSHOT_PATH = config("CATALOG_SNAPSHOT_PATH", default="")
+
+SNAPSHOT_MAGIC = b"ACNHSNAP"
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_HEADER = struct.Struct(">8sH")
+
+CATALOG_MODELS = {
+    "villagers": (schemas.Villager, CompactVillager),
+    "gyroids": (schemas.Gyroid, CompactGyroid),
+}
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def dump_snapshot(catalog_cache: CatalogCache, created_at: float | None = None) -> bytes:
+    resources = {}
+    for resource, (model, _) in CATALOG_MODELS.items():
+        entry = getattr(catalog_cache.snapshot, resource)
+        if entry is None:
+            continue
+        fields = list(model.model_fields)
+        resources[resource] = {
+            "etag": entry.etag,
+            "last_modified": entry.last_modified,
+            "fields": fields,
+            # one row per record, in field order, so keys are not repeated
+            "rows": [[value for value in item.model_dump(mode="json").values()] for item in entry.items],
+        }
+    body = msgpack.packb({
+        "created_at": time.time() if created_at is None else created_at,
+        "version": catalog_cache.snapshot.version,
+        "resources": resources,
+    })
+    return SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT) + body
+
+def parse_snapshot(buffer) -> dict:
+    if len(buffer) < SNAPSHOT_HEADER.size:
+        raise SnapshotError("Snapshot is truncated")
+    magic, version = SNAPSHOT_HEADER.unpack_from(buffer)
+    if magic != SNAPSHOT_MAGIC:
+        raise SnapshotError("Not a catalog snapshot")
+    if version != SNAPSHOT_FORMAT:
+        raise SnapshotError(f"Unsupported snapshot format {version}")
+    try:
+        return msgpack.unpackb(buffer[SNAPSHOT_HEADER.size:])
+    except (ValueError, msgpack.UnpackException) as exc:
+        raise SnapshotError("Snapshot is corrupt") from exc
+
+def read_snapshot(path: str) -> dict:
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            raise SnapshotError("Snapshot is truncated")
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                return parse_snapshot(view)
+
+def write_snapshot(catalog_cache: CatalogCache, path: str, created_at: float | None = None):
+    data = dump_snapshot(catalog_cache, created_at)
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile("wb", dir=directory, delete=False) as file:
+        file.write(data)
+    os.replace(file.name, path)
+
+def load_snapshot(catalog_cache: CatalogCache, path: str) -> list[str]:
+    """Load a snapshot file into the cache and return the resources it held.
+
+    Entries keep the snapshot's age, so stale ones are revalidated in the
+    background on first use.
+    """
+    return apply_snapshot(catalog_cache, read_snapshot(path))
+
+def apply_snapshot(catalog_cache: CatalogCache, snapshot: dict) -> list[str]:
+    age = max(time.time() - snapshot["created_at"], 0.0)
+    loaded = []
+    for resource, stored in snapshot["resources"].items():
+        if resource not in CATALOG_MODELS:
+            continue
+        model, compact = CATALOG_MODELS[resource]
+        if stored["fields"] != list(model.model_fields):
+            raise SnapshotError(f"Snapshot {resource} fields do not match the current schema")
+        try:
+            items = tuple(compact.from_model(model(**dict(zip(stored["fields"], row)))) for row in stored["rows"])
+        except ValidationError as exc:
+            raise SnapshotError(f"Snapshot {resource} records are invalid") from exc
+        catalog_cache.load(resource, items, etag=stored["etag"], last_modified=stored["last_modified"], age=age)
+        loaded.append(resource)
+    return loaded
+
+def start_from_snapshot(catalog_cache: CatalogCache, path: str) -> list[str]:
+    try:
+        loaded = load_snapshot(catalog_cache, path)
+    except (OSError, SnapshotError):
+        logger.exception("Could not load catalog snapshot %s, starting cold", path)
+        return []
+    if loaded:
+        # serve the snapshot however old it gets; upstream only refreshes it in the background
+        catalog_cache.stale_ttl = math.inf
+        for resource in loaded:
+            catalog_cache.revalidate_if_stale(resource)
+    return loaded
+
+
+async def fetch_catalog(catalog_cache: CatalogCache):
+    try:
+        for resource in CATALOG_RESOURCES:
+            await catalog_cache.refresh(resource)
+    finally:
+        await catalog_cache.upstream_client.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    write = commands.add_parser("write", help="fetch the catalog from Nookipedia and write a snapshot")
+    write.add_argument("path", nargs="?", default=CATALOG_SNAPSHOT_PATH or "catalog.snapshot")
+    info = commands.add_parser("info", help="describe a snapshot file")
+    info.add_argument("path", nargs="?", default=CATALOG_SNAPSHOT_PATH or "catalog.snapshot")
+    args = parser.parse_args()
+
+    if args.command == "write":
+        from main import catalog_cache
+
+        asyncio.run(fetch_catalog(catalog_cache))
+        write_snapshot(catalog_cache, args.path)
+
+    snapshot = read_snapshot(args.path)
+    created_at = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(snapshot["created_at"]))
+    print(f"{args.path}: format {SNAPSHOT_FORMAT}, catalog version {snapshot['version']}, written {created_at}")
+    for resource, stored in snapshot["resources"].items():
+        print(f"  {resource:<10} {len(stored['rows']):>6} records  etag {stored['etag']}")
+
+if __name__ == "__main__":
+    main()
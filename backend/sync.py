@@ -0,0 +1,213 @@
+from decouple import config
+from sqlalchemy import Engine, text
+from sqlalchemy.exc import DBAPIError
+from sqlmodel import Session
+
+from catalog import CATALOG_RESOURCES, CatalogCache
+import crud
+
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+CATALOG_SYNC_INTERVAL = config("CATALOG_SYNC_INTERVAL", default=0.0, cast=float)
+CATALOG_SYNC_LOCK_PATH = config("CATALOG_SYNC_LOCK_PATH", default=os.path.join(tempfile.gettempdir(), "acnh-catalog-sync.lock"))
+CATALOG_SYNC_LOCK_KEY = 0x4143_4E48
+
+UPSERTS = {
+    "villagers": crud.upsert_villagers,
+    "gyroids": crud.upsert_gyroids,
+}
+
+LOADERS = {
+    "villagers": crud.get_catalog_villagers,
+    "gyroids": crud.get_catalog_gyroids,
+}
+
+logger = logging.getLogger(__name__)
+
+
+class SyncLock:
+    """Leader lock held by the one worker that syncs the catalog.
+
+    PostgreSQL deployments use a session advisory lock; everything else, or
+    a lock created without an engine for a host-local leader, uses an
+    exclusive ``flock`` on a file shared by the workers of a host. Both are
+    released by the OS or server if the holder dies, so another worker takes
+    over on its next tick. The calls block, so async callers run them in a
+    thread.
+    """
+
+    def __init__(self, engine: Engine | None, path: str = CATALOG_SYNC_LOCK_PATH):
+        self.engine = engine
+        self.path = path
+        self.held = False
+        self._connection = None
+        self._file = None
+
+    def acquire(self) -> bool:
+        if self.held and self._connection is not None and not self._connection_alive():
+            # the server dropped the session and its advisory lock with it; another worker may lead now
+            logger.warning("Lost the catalog sync lock connection")
+            self._close_connection()
+            self.held = False
+        if self.held:
+            return True
+        if self.engine is not None and self.engine.dialect.name == "postgresql":
+            self._connection = self.engine.connect()
+            self.held = bool(self._connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": CATALOG_SYNC_LOCK_KEY}).scalar())
+            # the advisory lock belongs to the session, so committing keeps it while the
+            # long-lived connection stops sitting idle in a transaction
+            self._connection.commit()
+            if not self.held:
+                self._connection.close()
+                self._connection = None
+        elif fcntl is None:
+            self.held = True
+        else:
+            self._file = open(self.path, "a+")
+            try:
+                fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self.held = True
+            except BlockingIOError:
+                self._file.close()
+                self._file = None
+        return self.held
+
+    def _connection_alive(self) -> bool:
+        try:
+            self._connection.execute(text("SELECT 1"))
+            self._connection.commit()
+        except DBAPIError:
+            return False
+        return True
+
+    def _close_connection(self):
+        try:
+            self._connection.close()
+        except DBAPIError:
+            pass
+        self._connection = None
+
+    def release(self):
+        if self._connection is not None:
+            try:
+                self._connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": CATALOG_SYNC_LOCK_KEY})
+                self._connection.commit()
+            except DBAPIError:
+                logger.warning("Could not unlock the catalog sync lock, its connection is gone")
+            self._close_connection()
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self.held = False
+
+
+class CatalogSync:
+    """Periodically syncs the upstream catalog into the database.
+
+    The worker holding the ``SyncLock`` fetches upstream, skips catalogs whose
+    digest has not changed since its last run and upserts the changed rows of
+    the rest in one transaction. Every other worker refreshes its in-memory
+    catalog from the database instead, so request handlers are answered from
+    memory and only the leader talks to upstream.
+    """
+
+    def __init__(self, catalog_cache: CatalogCache, engine: Engine, interval: float = CATALOG_SYNC_INTERVAL, lock: SyncLock | None = None):
+        self.catalog_cache = catalog_cache
+        self.engine = engine
+        self.interval = interval
+        self.lock = lock or SyncLock(engine)
+        self._digests: dict[str, str] = {}
+        self._task: asyncio.Task | None = None
+        self.runs = 0
+        self.last_run: float | None = None
+        self.last_result: dict = {}
+
+    async def start(self):
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self.lock.release)
+
+    async def _run_forever(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Catalog sync failed")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> dict:
+        if await asyncio.to_thread(self.lock.acquire):
+            result = await self._sync_from_upstream()
+        else:
+            result = await self._load_from_database()
+        self.runs += 1
+        self.last_run = time.time()
+        self.last_result = result
+        return result
+
+    async def _sync_from_upstream(self) -> dict:
+        changed = {}
+        for resource in CATALOG_RESOURCES:
+            entry = await self.catalog_cache.refresh(resource)
+            if entry.digest != self._digests.get(resource):
+                changed[resource] = (entry.items, entry.digest)
+
+        result = {"leader": True, "unchanged": [resource for resource in CATALOG_RESOURCES if resource not in changed]}
+        if changed:
+            result.update(await asyncio.to_thread(self._apply, {resource: items for resource, (items, _) in changed.items()}))
+            self._digests.update({resource: digest for resource, (_, digest) in changed.items()})
+        return result
+
+    def _apply(self, changed: dict[str, tuple]) -> dict[str, dict[str, int]]:
+        with Session(self.engine) as db:
+            counts = {resource: UPSERTS[resource](db, items) for resource, items in changed.items()}
+            db.commit()
+        return counts
+
+    async def _load_from_database(self) -> dict:
+        loaded = await asyncio.to_thread(self._read_catalog)
+        for resource, items in loaded.items():
+            if items:
+                self.catalog_cache.load(resource, items)
+        return {"leader": False, "loaded": {resource: len(items) for resource, items in loaded.items()}}
+
+    def _read_catalog(self) -> dict[str, tuple]:
+        with Session(self.engine) as db:
+            return {resource: LOADERS[resource](db) for resource in CATALOG_RESOURCES}
+
+    async def read_resource(self, resource: str) -> tuple:
+        """The copy of ``resource`` last synced to the database, the catalog fallback while upstream is down."""
+        return await asyncio.to_thread(self._read_resource, resource)
+
+    def _read_resource(self, resource: str) -> tuple:
+        with Session(self.engine) as db:
+            return LOADERS[resource](db)
+
+    def stats(self) -> dict:
+        return {
+            "interval": self.interval,
+            "leader": self.lock.held,
+            "runs": self.runs,
+            "last_run": self.last_run,
+            "last_result": self.last_result,
+        }
@@ -1,27 +1,64 @@
 from fastapi.testclient import TestClient
+import httpx
 import pytest
-from unittest.mock import MagicMock, patch
-from sqlmodel import create_engine, Session
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+from sqlmodel import create_engine, select, Session, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
 import database
-from main import app
+from main import app, catalog_cache, search_index, upstream_client
+from shared import SharedCatalog
+from sync import CatalogSync, SyncLock
+from upstream import UpstreamClient, UpstreamError
+import analytics
+import catalog
+import compact
+import crud
+import metrics
 import models
+import schemas
+import search
+import snapshot
+import upstream
+
+import alembic.command
+import alembic.config
+import asyncio
+import gc
+import gzip
+import json
+import time
+import tracemalloc
 
 
 client = TestClient(app)
 
 
+def mock_upstream(payload, status_code=200, headers=None):
+    response = httpx.Response(status_code, json=payload, headers=headers)
+    return patch("main.upstream_client.get", new=AsyncMock(return_value=response))
+
+
+@pytest.fixture(autouse=True)
+def clear_catalog_cache():
+    catalog_cache.clear()
+    yield
+    catalog_cache.clear()
+
+
 def test_get_villagers():
-    with patch("main.requests.get") as mock_get:
-        mock_get.return_value.status_code = 200
-        mock_get.return_value.json.return_value = [
-            {
-                "id": "cat00",
-                "name": "Bob",
-                "species": "cat",
-                "personality": "lazy",
-                "quote": "You only live once...or nine times."
-            }
-        ]
+    with mock_upstream([
+        {
+            "id": "cat00",
+            "name": "Bob",
+            "species": "cat",
+            "personality": "lazy",
+            "quote": "You only live once...or nine times."
+        }
+    ]):
 
         response = client.get(f"/villagers?species=cat&personality=lazy")
 
@@ -38,15 +75,30 @@ def test_get_villagers():
         ]
         assert response.json() == expected_response
 
+def test_get_villagers_multi_value_filters():
+    with mock_upstream([
+        {"id": "cat00", "name": "Bob", "species": "cat", "personality": "lazy", "quote": "You only live once...or nine times."},
+        {"id": "dog00", "name": "Goldie", "species": "dog", "personality": "normal", "quote": "Nothing's ever easy."},
+        {"id": "cat21", "name": "Katt", "species": "cat", "personality": "big sister", "quote": "MeowMEOWmeow!"},
+        {"id": "duk00", "name": "Joey", "species": "duck", "personality": "lazy", "quote": "Seize the day."},
+    ]):
+        # in catalog order, which is sorted by id whatever order upstream sent
+        response = client.get("/villagers?species=cat&species=dog")
+        assert [villager["villager_id"] for villager in response.json()] == ["cat00", "cat21", "dog00"]
+
+        response = client.get("/villagers?species=cat&species=duck&personality=lazy")
+        assert [villager["villager_id"] for villager in response.json()] == ["cat00", "duk00"]
+
+        response = client.get("/villagers?species=dog&personality=lazy")
+        assert response.json() == []
+
 def test_get_gyroids():
-    with patch("main.requests.get") as mock_get:
-        mock_get.return_value.status_code = 200
-        mock_get.return_value.json.return_value = [
-            {
-                "name": "bubbloid",
-                "sound": "Melody"
-            }
-        ]
+    with mock_upstream([
+        {
+            "name": "bubbloid",
+            "sound": "Melody"
+        }
+    ]):
         
         response = client.get("/gyroids")
 
@@ -60,21 +112,526 @@ def test_get_gyroids():
         ]
         assert response.json() == expected_response
 
+def test_get_villagers_served_from_cache():
+    villager_json = {"id": "cat00", "name": "Bob", "species": "cat", "personality": "lazy", "quote": "You only live once...or nine times."}
+    with mock_upstream([villager_json]) as mock_get:
+        client.get("/villagers?species=cat")
+        response = client.get("/villagers?species=cat&personality=lazy")
+
+    assert response.status_code == 200
+    assert response.json()[0]["villager_id"] == "cat00"
+    mock_get.assert_awaited_once()
+
+    stats = client.get("/catalog/stats").json()["villagers"]
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["age_seconds"] is not None
+
+def test_catalog_cache_revalidates_with_etag():
+    gyroid_json = {"name": "bubbloid", "sound": "Melody"}
+    with mock_upstream([gyroid_json], headers={"ETag": '"v1"'}):
+        client.get("/gyroids")
+
+    with patch.object(catalog_cache, "ttl", 0), patch.object(catalog_cache, "stale_ttl", 0):
+        with patch("main.upstream_client.get", new=AsyncMock(return_value=httpx.Response(304))) as mock_get:
+            response = client.get("/gyroids")
+
+    assert response.status_code == 200
+    assert mock_get.await_args.kwargs["headers"]["If-None-Match"] == '"v1"'
+    assert catalog_cache.stats()["gyroids"]["revalidations"] == 1
+
+def test_catalog_cache_coalesces_concurrent_fetches():
+    calls = []
+
+    async def upstream_get(path, **kwargs):
+        calls.append(path)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json=[{"name": "bubbloid", "sound": "Melody"}])
+
+    async def burst():
+        return await asyncio.gather(*(catalog_cache.get("gyroids") for _ in range(5)), catalog_cache.refresh("gyroids"))
+
+    with patch("main.upstream_client.get", new=upstream_get):
+        entries = asyncio.run(burst())
+
+    assert calls == ["/nh/gyroids"]
+    assert all(entry is entries[0] for entry in entries)
+    stats = catalog_cache.stats()["gyroids"]
+    assert stats["misses"] == 5
+    assert stats["refreshes"] == 1
+    assert stats["coalesced"] == 5
+
+    async def failing_get(path, **kwargs):
+        calls.append(path)
+        await asyncio.sleep(0.05)
+        return httpx.Response(503)
+
+    async def failing_burst():
+        return await asyncio.gather(*(catalog_cache.refresh("gyroids") for _ in range(3)), return_exceptions=True)
+
+    with patch("main.upstream_client.get", new=failing_get):
+        errors = asyncio.run(failing_burst())
+
+    assert len(calls) == 2
+    assert all(isinstance(error, UpstreamError) and error.status_code == 503 for error in errors)
+    assert catalog_cache.stats()["gyroids"]["errors"] == 1
+
+def test_catalog_refresh_streams_projected_records():
+    payload = [
+        {"id": "cat00", "name": "Bob", "species": "Cat", "personality": "Lazy", "quote": "You only live once...or nine times.",
+         "nh_details": {"quote": "Nested quote", "fav_colors": ["Blue"]}, "appearances": ["DNM", "NH"], "islander": False},
+        {"id": "dog00", "name": "Goldie", "species": "Dog", "personality": "Normal"},
+        "not a record",
+        {"name": "bubbloid", "sound": "Melody", "variations": [{"variation": "Green"}]},
+    ]
+    body = json.dumps(payload).encode()
+
+    async def chunks():
+        for i in range(0, len(body), 16):
+            yield body[i:i + 16]
+
+    def handler(request):
+        if request.url.path == "/broken":
+            return httpx.Response(200, content=body[:-10])
+        return httpx.Response(200, content=body if request.url.path == "/nh/gyroids" else chunks())
+
+    async def refresh(cache, resource):
+        try:
+            return await cache.refresh(resource)
+        finally:
+            await cache.upstream_client.close()
+
+    for ijson_module in (catalog.ijson, None):
+        cache = catalog.CatalogCache(UpstreamClient("https://upstream.test", {}, transport=httpx.MockTransport(handler)))
+        with patch("catalog.ijson", ijson_module):
+            villagers = asyncio.run(refresh(cache, "villagers")).items
+            gyroids = asyncio.run(refresh(cache, "gyroids")).items
+
+        assert [villager.model_dump() for villager in villagers] == [
+            {"villager_id": "cat00", "name": "Bob", "species": "cat", "personality": "lazy", "quote": "You only live once...or nine times."}
+        ]
+        assert [gyroid.name for gyroid in gyroids] == ["bubbloid"]
+
+    # a small sized body is decoded whole; larger ones are streamed to the same records
+    expected = {"id": "cat00", "name": "Bob", "species": "Cat", "personality": "Lazy", "quote": "You only live once...or nine times."}
+    with patch.object(catalog.ijson, "items_async", side_effect=AssertionError("small body was streamed")):
+        records = asyncio.run(catalog.read_records(httpx.Response(200, content=body), catalog.CATALOG_FIELDS["villagers"]))
+    assert records[0] == expected
+    with patch("catalog.CATALOG_STREAM_MIN_BYTES", 0):
+        records = asyncio.run(catalog.read_records(httpx.Response(200, content=body), catalog.CATALOG_FIELDS["villagers"]))
+    assert records[0] == expected
+
+    cache = catalog.CatalogCache(UpstreamClient("https://upstream.test", {}, transport=httpx.MockTransport(handler)))
+    with patch.dict(catalog.CATALOG_RESOURCES, {"villagers": ("/broken", "Failed to fetch villagers from API")}):
+        with pytest.raises(UpstreamError) as error:
+            asyncio.run(refresh(cache, "villagers"))
+    assert error.value.status_code == 502
+    assert cache.stats()["villagers"]["errors"] == 1
+
+def test_catalog_keeps_compact_interned_records():
+    payload = [
+        {"id": "cat00", "name": "Bob", "species": "Cat", "personality": "Lazy", "quote": "You only live once...or nine times."},
+        {"id": "cat21", "name": "Katt", "species": "cat", "personality": "big sister", "quote": "MeowMEOWmeow!"},
+    ]
+    first = catalog.parse_villagers(json.loads(json.dumps(payload)))
+    second = catalog.parse_villagers(json.loads(json.dumps(payload)))
+
+    assert all(isinstance(villager, compact.CompactVillager) for villager in first)
+    assert not hasattr(first[0], "__dict__")
+    assert first == second and hash(first[0]) == hash(second[0])
+    assert first[0].name is second[0].name
+    assert first[1].species is schemas.Species.CAT and first[1].personality is schemas.Personality.BIG_SISTER
+    assert first[1].model_dump(mode="json") == {"villager_id": "cat21", "name": "Katt", "species": "cat", "personality": "big sister", "quote": "MeowMEOWmeow!"}
+    assert first[1].to_model() == schemas.Villager(villager_id="cat21", name="Katt", species="cat", personality="big sister", quote="MeowMEOWmeow!")
+
+    gyroids = catalog.parse_gyroids([{"name": "bubbloid", "sound": "Melody"}, {"name": "dingloid", "sound": "Melody"}])
+    assert gyroids[0].sound is gyroids[1].sound
+    assert gyroids[0].to_model() == schemas.Gyroid(name="bubbloid", sound="Melody")
+
+def test_get_villagers_reuses_serialized_body():
+    villager_json = {"id": "cat00", "name": "Bob", "species": "cat", "personality": "lazy", "quote": "You only live once...or nine times."}
+    with mock_upstream([villager_json]):
+        first = client.get("/villagers?species=cat&personality=lazy")
+        body = catalog_cache.snapshot.villagers.body((("cat",), ("lazy",)), lambda: pytest.fail("body was not cached"))
+        with patch("catalog.orjson.dumps", side_effect=AssertionError("body serialized twice")):
+            second = client.get("/villagers?personality=lazy&species=cat&species=cat")
+
+    assert first.headers["content-type"] == "application/json"
+    assert first.content == second.content == body
+    assert first.json() == [{"villager_id": "cat00", "name": "Bob", "species": "cat", "personality": "lazy", "quote": "You only live once...or nine times."}]
+
+    catalog_cache.load("villagers", catalog.parse_villagers([{**villager_json, "quote": "Nine lives."}]))
+    assert client.get("/villagers?species=cat&personality=lazy").json()[0]["quote"] == "Nine lives."
+
+    assert client.get("/fruit").json() == ["Apple", "Cherry", "Orange", "Pear", "Peach"]
+
+def test_catalog_snapshot_serves_without_upstream(tmp_path):
+    villager_json = {"id": "cat00", "name": "Bob", "species": "cat", "personality": "lazy", "quote": "You only live once...or nine times."}
+    with mock_upstream([villager_json], headers={"ETag": '"v1"'}):
+        expected = client.get("/villagers?species=cat").json()
+    with mock_upstream([{"name": "bubbloid", "sound": "Melody"}]):
+        client.get("/gyroids")
+
+    path = str(tmp_path / "catalog.snapshot")
+    snapshot.write_snapshot(catalog_cache, path)
+    catalog_cache.clear()
+
+    unreachable = AsyncMock(side_effect=httpx.ConnectError("Nookipedia is down"))
+    with patch("main.upstream_client.get", new=unreachable), patch("main.CATALOG_SNAPSHOT_PATH", path), \
+            patch.object(catalog_cache, "stale_ttl", catalog_cache.stale_ttl):
+        with TestClient(app) as lifespan_client:
+            assert lifespan_client.get("/villagers?species=cat").json() == expected
+            assert lifespan_client.get("/gyroids").json() == [{"name": "bubbloid", "sound": "Melody"}]
+            assert catalog_cache.snapshot.villagers.etag == '"v1"'
+            assert catalog_cache.stale_ttl == float("inf")
+    unreachable.assert_not_awaited()
+
+    with open(path, "r+b") as file:
+        file.write(b"NOTASNAP")
+    with pytest.raises(snapshot.SnapshotError):
+        snapshot.read_snapshot(path)
+    catalog_cache.clear()
+    assert snapshot.start_from_snapshot(catalog_cache, path) == []
+    assert catalog_cache.snapshot.villagers is None
+
+def test_get_gyroids_memory_is_bounded():
+    gyroid_json = [{"name": f"gyroid{i}", "sound": "Melody"} for i in range(50)]
+    gyroid_json.append({"name": "gyroid0", "sound": "Melody"})
+
+    async def upstream_get(path, **kwargs):
+        return httpx.Response(200, json=gyroid_json)
+
+    with patch("main.upstream_client.get", new=upstream_get), patch.object(catalog_cache, "ttl", 0), patch.object(catalog_cache, "stale_ttl", 0):
+        tracemalloc.start()
+        for _ in range(100):
+            client.get("/gyroids")
+        gc.collect()
+        baseline, _ = tracemalloc.get_traced_memory()
+        for _ in range(2000):
+            response = client.get("/gyroids")
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    assert len(response.json()) == 50
+    assert len(catalog_cache.snapshot.gyroids.items) == 50
+    assert current - baseline < 256 * 1024
+
+def test_get_villagers_etag_not_modified():
+    villager_json = {"id": "cat00", "name": "Bob", "species": "cat", "personality": "lazy", "quote": "You only live once...or nine times."}
+    with mock_upstream([villager_json]) as mock_get:
+        response = client.get("/villagers?species=cat")
+        etag = response.headers["etag"]
+        assert response.headers["cache-control"] == "public, max-age=300, stale-while-revalidate=3600"
+
+        response = client.get("/villagers?species=cat", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+
+        other = client.get("/villagers?species=cat&personality=lazy", headers={"If-None-Match": etag})
+        assert other.status_code == 200
+        assert other.headers["etag"] != etag
+
+    mock_get.assert_awaited_once()
+
+    with mock_upstream([{**villager_json, "quote": "Nine lives."}]):
+        with patch.object(catalog_cache, "ttl", 0), patch.object(catalog_cache, "stale_ttl", 0):
+            response = client.get("/villagers?species=cat", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+        asyncio.run(catalog_cache.refresh("villagers"))
+        response = client.get("/villagers?species=cat", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+def test_get_fruit_etag_and_gyroids_compression():
+    response = client.get("/fruit")
+    assert response.json() == ["Apple", "Cherry", "Orange", "Pear", "Peach"]
+    assert client.get("/fruit", headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+
+    gyroids_json = [{"name": f"gyroid{i}", "sound": "Melody"} for i in range(100)]
+    with mock_upstream(gyroids_json):
+        response = client.get("/gyroids", headers={"Accept-Encoding": "gzip"})
+        identity = client.get("/gyroids", headers={"Accept-Encoding": "identity"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()) == 100
+    # the same validator is sent for both codings, so it must be weak
+    assert "content-encoding" not in identity.headers
+    assert response.headers["etag"] == identity.headers["etag"]
+    assert response.headers["etag"].startswith('W/"')
+    etag = response.headers["etag"].removeprefix("W/")
+    assert client.get("/gyroids", headers={"If-None-Match": etag, "Accept-Encoding": "gzip"}).status_code == 304
+
+def test_get_villagers_upstream_error():
+    with mock_upstream({"title": "Unauthorized"}, status_code=401):
+        response = client.get("/villagers?species=cat")
+
+    assert response.status_code == 401
+    assert response.json() == {"detail": "Failed to fetch villagers from API"}
+
+SEARCH_VILLAGERS = [
+    {"id": "cat00", "name": "Bob", "species": "cat", "personality": "lazy", "quote": "You only live once...or nine times."},
+    {"id": "bea01", "name": "Bluebear", "species": "cub", "personality": "peppy", "quote": "Life is sweet."},
+    {"id": "ham00", "name": "Apple", "species": "hamster", "personality": "peppy", "quote": "Bob and weave!"},
+]
+SEARCH_GYROIDS = [
+    {"name": "bubbloid", "sound": "Melody"},
+    {"name": "boomoid", "sound": "Drum set"},
+]
+
+def mock_search_upstream(villagers_json, gyroids_json):
+    async def upstream_get(path, **kwargs):
+        return httpx.Response(200, json=villagers_json if path == "/villagers" else gyroids_json)
+    return patch("main.upstream_client.get", new=upstream_get)
+
+def test_search_prefix_ranking():
+    with mock_search_upstream(SEARCH_VILLAGERS, SEARCH_GYROIDS):
+        response = client.get("/search?q=b")
+        assert [result["id"] for result in response.json()] == ["bea01", "cat00", "boomoid", "bubbloid", "ham00"]
+
+        response = client.get("/search?q=bob")
+        assert [result["id"] for result in response.json()] == ["cat00", "ham00"]
+
+        response = client.get("/search?q=bob wea")
+        assert [result["id"] for result in response.json()] == ["ham00"]
+
+        response = client.get("/search?q=b&kind=gyroid&limit=1")
+        assert response.json() == [{"kind": "gyroid", "id": "boomoid", "name": "boomoid", "score": 8.0}]
+
+def test_search_index_updates_incrementally():
+    with mock_search_upstream(SEARCH_VILLAGERS, SEARCH_GYROIDS):
+        client.get("/search?q=bob")
+    assert len(search_index) == 5
+
+    changed = [SEARCH_VILLAGERS[0], {**SEARCH_VILLAGERS[2], "quote": "Nibble nibble!"}]
+    with mock_search_upstream(changed, SEARCH_GYROIDS):
+        asyncio.run(catalog_cache.refresh("villagers"))
+
+    assert len(search_index) == 4
+    assert [result.id for result in search_index.search("bob")] == ["cat00"]
+    assert [result.id for result in search_index.search("nibb")] == ["ham00"]
+    assert search_index.update("gyroid", search.gyroid_documents(catalog_cache.snapshot.gyroids.items)) == {"indexed": 0, "removed": 0}
+
+@pytest.fixture
+def migrated_sqlite_url(tmp_path, monkeypatch):
+    url = f"sqlite:///{tmp_path / 'migrated.db'}"
+    monkeypatch.setenv("DATABASE_URL", url)
+    alembic.command.upgrade(alembic.config.Config("alembic.ini"), "head")
+    return url
+
+def test_search_database_fts(migrated_sqlite_url):
+    engine = create_engine(migrated_sqlite_url)
+    with Session(engine) as session:
+        crud.upsert_villagers(session, catalog.parse_villagers(SEARCH_VILLAGERS))
+        crud.upsert_gyroids(session, catalog.parse_gyroids(SEARCH_GYROIDS))
+        session.commit()
+        crud.upsert_villagers(session, catalog.parse_villagers([{**SEARCH_VILLAGERS[2], "quote": "Nibble nibble!"}]))
+        session.commit()
+    engine.dispose()
+
+    async def run(query, **kwargs):
+        async_engine = create_async_engine(database.to_async_url(migrated_sqlite_url), poolclass=NullPool)
+        async with AsyncSession(async_engine) as session:
+            results = await search.search_database(session, query, **kwargs)
+        await async_engine.dispose()
+        return [result.id for result in results]
+
+    assert asyncio.run(run("bob")) == ["cat00"]
+    assert asyncio.run(run("nib")) == ["ham00"]
+    assert sorted(asyncio.run(run("b", kinds=["gyroid"]))) == ["boomoid", "bubbloid"]
+
+def test_upstream_client_retries_unavailable():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(503)
+        return httpx.Response(200, json=[])
+
+    upstream_client = UpstreamClient("https://upstream.test", {"X-API-KEY": "key"}, transport=httpx.MockTransport(handler))
+
+    async def fetch():
+        try:
+            return await upstream_client.get("/villagers")
+        finally:
+            await upstream_client.close()
+
+    def attempts(status):
+        return metrics.registry.get_sample_value(
+            "upstream_request_duration_seconds_count", {"path": "/villagers", "status": status}
+        ) or 0
+
+    before = attempts("503"), attempts("200")
+    with patch("upstream.UPSTREAM_RETRY_BACKOFF", 0):
+        response = asyncio.run(fetch())
+
+    assert response.status_code == 200
+    assert len(calls) == 2
+    assert (attempts("503"), attempts("200")) == (before[0] + 1, before[1] + 1)
+    assert calls[0].headers["X-API-KEY"] == "key"
+
+def test_upstream_client_retries_connect_errors_once_per_attempt():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        raise httpx.ConnectError("Connection refused")
+
+    upstream_client = UpstreamClient("https://upstream.test", {}, transport=httpx.MockTransport(handler))
+
+    with patch("upstream.UPSTREAM_RETRY_BACKOFF", 0), pytest.raises(httpx.ConnectError):
+        asyncio.run(upstream_client.get("/villagers"))
+
+    assert len(calls) == upstream.UPSTREAM_RETRIES + 1
+    assert upstream_client.breaker.failures == 1
+    # the retry loop above is the only retry layer; the pooled transport does not retry connects itself
+    assert UpstreamClient("https://upstream.test", {}).client._transport._pool._retries == 0
+
+def test_upstream_circuit_breaker_fails_fast():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503 if len(calls) <= 2 else 200, json=[])
+
+    breaker = upstream.CircuitBreaker(threshold=2, reset_timeout=30)
+    upstream_client = UpstreamClient("https://upstream.test", {}, transport=httpx.MockTransport(handler), breaker=breaker)
+
+    async def fetch():
+        return await upstream_client.get("/villagers")
+
+    with patch("upstream.UPSTREAM_RETRIES", 0):
+        assert asyncio.run(fetch()).status_code == 503
+        assert breaker.state == "closed"
+        assert asyncio.run(fetch()).status_code == 503
+        assert breaker.state == "open"
+
+        with pytest.raises(upstream.CircuitOpenError) as error:
+            asyncio.run(fetch())
+        assert len(calls) == 2
+        assert error.value.status_code == 503
+        assert 29 < error.value.retry_after <= 30
+
+        # once the open period is over a single probe goes through and closes the circuit
+        breaker.opened_until = time.monotonic()
+        assert breaker.state == "half_open"
+        assert asyncio.run(fetch()).status_code == 200
+        assert breaker.state == "closed"
+    assert len(calls) == 3
+
+def test_upstream_client_honours_retry_after():
+    responses = [
+        httpx.Response(429, headers={"Retry-After": "0"}),
+        httpx.Response(200, json=[]),
+        httpx.Response(429, headers={"Retry-After": "120"}),
+    ]
+    upstream_client = UpstreamClient("https://upstream.test", {}, transport=httpx.MockTransport(lambda request: responses.pop(0)))
+
+    async def fetch():
+        return await upstream_client.get("/villagers")
+
+    with patch("upstream.UPSTREAM_RETRY_BACKOFF", 0):
+        assert asyncio.run(fetch()).status_code == 200
+        # too long to wait for in a request: answered at once and the circuit stays open for it
+        assert asyncio.run(fetch()).status_code == 429
+    assert responses == []
+    assert upstream_client.breaker.state == "open"
+    assert 119 < upstream_client.breaker.retry_after <= 120
+    assert upstream.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+def test_token_bucket_limits_upstream_calls():
+    bucket = upstream.TokenBucket(rate=20, capacity=1, max_wait=0.2)
+
+    async def acquire(times):
+        start = time.monotonic()
+        for _ in range(times):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(acquire(1)) < 0.01
+    assert asyncio.run(acquire(2)) >= 0.09
+    assert bucket.throttled == 2
+
+    bucket.max_wait = 0.01
+    with pytest.raises(UpstreamError) as error:
+        asyncio.run(acquire(2))
+    assert error.value.status_code == 503
+
+def test_catalog_falls_back_while_circuit_open():
+    with mock_upstream([{"name": "bubbloid", "sound": "Melody"}]):
+        client.get("/gyroids")
+
+    open_circuit = patch.object(upstream_client.breaker, "opened_until", time.monotonic() + 60)
+    with open_circuit, patch.object(catalog_cache, "ttl", 0), patch.object(catalog_cache, "stale_ttl", 0):
+        response = client.get("/gyroids")
+        sync_response = client.post("/add_gyroids")
+
+    assert response.status_code == 200
+    assert response.json() == [{"name": "bubbloid", "sound": "Melody"}]
+    assert catalog_cache.stats()["gyroids"]["fallbacks"] == 1
+    assert sync_response.status_code == 503
+    assert 0 < int(sync_response.headers["Retry-After"]) <= 60
+
+    # with nothing in memory the last copy synced to the database is served
+    calls = []
+    cache = catalog.CatalogCache(UpstreamClient("https://upstream.test", {}, transport=httpx.MockTransport(calls.append)))
+    cache.upstream_client.breaker.opened_until = time.monotonic() + 60
+
+    async def from_database(resource):
+        return catalog.parse_gyroids([{"name": "boomoid", "sound": "Drum set"}])
+
+    cache.set_fallback(from_database)
+    entry = asyncio.run(cache.get("gyroids"))
+    assert [gyroid.name for gyroid in entry.items] == ["boomoid"]
+    assert calls == []
+    assert cache.stats()["gyroids"]["fallbacks"] == 1
+
 @pytest.fixture
 def db_session():
-    session = MagicMock(spec=Session)
+    session = MagicMock(spec=AsyncSession)
+    session.exec = AsyncMock(return_value=MagicMock())
+    session.bind = MagicMock()
+    session.bind.dialect.name = "sqlite"
     return session
 
 @pytest.fixture
 def override_get_db(db_session):
-    def _override_get_db():
+    async def _override_get_db():
         try:
             yield db_session
         finally:
             pass
-    app.dependency_overrides[database.get_db] = _override_get_db
+    app.dependency_overrides[database.get_async_db] = _override_get_db
     yield
-    app.dependency_overrides.pop(database.get_db)
+    app.dependency_overrides.pop(database.get_async_db)
+
+@pytest.fixture
+def sqlite_url(tmp_path):
+    return f"sqlite:///{tmp_path / 'test.db'}"
+
+@pytest.fixture
+def sqlite_session(sqlite_url):
+    engine = create_engine(sqlite_url, connect_args={"check_same_thread": False})
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+@pytest.fixture
+def async_sqlite_engine(sqlite_url, sqlite_session):
+    # NullPool: TestClient runs every request on its own event loop
+    return create_async_engine(database.to_async_url(sqlite_url), poolclass=NullPool)
+
+@pytest.fixture
+def override_get_db_sqlite(async_sqlite_engine):
+    async def _override_get_db():
+        async with AsyncSession(async_sqlite_engine, expire_on_commit=False) as session:
+            yield session
+    app.dependency_overrides[database.get_async_db] = _override_get_db
+    yield
+    app.dependency_overrides.pop(database.get_async_db)
 
 def test_get_users(override_get_db, db_session):
     user1 = models.Users(user_id = 1, username="user1", native_fruit="Apple")
@@ -96,6 +653,142 @@ def test_get_users(override_get_db, db_session):
     ]
     assert response.json() == expected_users
 
+def test_get_users_keyset_pagination(override_get_db_sqlite, sqlite_session):
+    fruits = ["Apple", "Cherry", "Orange", "Pear", "Peach"]
+    for user_id in range(1, 8):
+        sqlite_session.add(models.Users(user_id=user_id, username=f"user{user_id}", native_fruit=fruits[user_id % 2]))
+    sqlite_session.commit()
+
+    pages = []
+    cursor = None
+    while True:
+        response = client.get("/users", params={"limit": 3, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        pages.append([user["user_id"] for user in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert pages == [[1, 2, 3], [4, 5, 6], [7]]
+
+    response = client.get("/users", params={"native_fruit": "Cherry", "limit": 2})
+    assert [user["user_id"] for user in response.json()] == [1, 3]
+    response = client.get("/users", params={"native_fruit": "Cherry", "cursor": response.headers["X-Next-Cursor"]})
+    assert [user["user_id"] for user in response.json()] == [5, 7]
+    assert "X-Next-Cursor" not in response.headers
+
+    assert client.get("/users", params={"cursor": "not-a-cursor"}).status_code == 400
+
+@pytest.fixture
+def island_users(sqlite_session):
+    villagers = [
+        models.Villager(villager_id=f"cat{i:02d}", name=f"Cat {i}", species="cat", personality="lazy", quote="Meow.")
+        for i in range(4)
+    ]
+    gyroids = [models.Gyroid(gyroid_name=f"gyroid{i}", sound="Melody") for i in range(3)]
+    for user_id in range(1, 6):
+        user = models.Users(user_id=user_id, username=f"user{user_id}", native_fruit="Apple")
+        user.villagers = villagers[:user_id % 4 + 1]
+        user.gyroids = gyroids[:user_id % 3]
+        sqlite_session.add(user)
+    sqlite_session.commit()
+    sqlite_session.expunge_all()
+
+@pytest.fixture
+def statement_counter(async_sqlite_engine):
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = async_sqlite_engine.sync_engine
+    event.listen(engine, "before_cursor_execute", count)
+    yield statements
+    event.remove(engine, "before_cursor_execute", count)
+
+def test_get_user_profile(override_get_db_sqlite, island_users, statement_counter):
+    response = client.get("/users/2")
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "user_id": 2,
+        "username": "user2",
+        "native_fruit": "Apple",
+        "villagers": [
+            {"villager_id": f"cat{i:02d}", "name": f"Cat {i}", "species": "cat", "personality": "lazy", "quote": "Meow."}
+            for i in range(3)
+        ],
+        "gyroids": [{"name": "gyroid0", "sound": "Melody"}, {"name": "gyroid1", "sound": "Melody"}],
+    }
+    assert len(statement_counter) == 3
+
+    assert client.get("/users/99").status_code == 404
+
+def test_metrics_records_route_latency_and_db_statements(override_get_db_sqlite, island_users, statement_counter):
+    def sample(name, labels):
+        return metrics.registry.get_sample_value(name, labels) or 0
+
+    route = {"route": "/users/{user_id}"}
+    requests_before = sample("http_request_duration_seconds_count", {"method": "GET", "status": "200", **route})
+    statements_before = sample("http_request_db_statements_sum", route)
+
+    assert client.get("/users/2").status_code == 200
+    assert client.get("/users/99").status_code == 404
+
+    assert sample("http_request_duration_seconds_count", {"method": "GET", "status": "200", **route}) == requests_before + 1
+    assert sample("http_request_db_statements_sum", route) == statements_before + len(statement_counter)
+
+    with mock_upstream([{"id": "cat00", "name": "Bob", "species": "cat", "personality": "lazy", "quote": "Meow."}]):
+        client.get("/villagers?species=cat")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_request_duration_seconds_count{method="GET",route="/users/{user_id}",status="404"}' in response.text
+    assert 'catalog_cache_lookups_total{resource="villagers",result="misses"} 1.0' in response.text
+    assert 'catalog_cache_size{resource="villagers"} 1.0' in response.text
+
+def test_get_users_expand_uses_constant_queries(override_get_db_sqlite, island_users, statement_counter):
+    response = client.get("/users?expand=villagers,gyroids")
+
+    assert response.status_code == 200
+    users = response.json()
+    assert [len(user["villagers"]) for user in users] == [2, 3, 4, 1, 2]
+    assert [len(user["gyroids"]) for user in users] == [1, 2, 0, 1, 2]
+    assert len(statement_counter) == 3
+
+    statement_counter.clear()
+    response = client.get("/users?expand=villagers")
+    assert "gyroids" not in response.json()[0]
+    assert len(statement_counter) == 2
+
+    statement_counter.clear()
+    response = client.get("/users")
+    assert "villagers" not in response.json()[0]
+    assert len(statement_counter) == 1
+
+    assert client.get("/users?expand=museum").status_code == 400
+
+def test_export_users_ndjson(override_get_db_sqlite, island_users, statement_counter):
+    with patch("export.EXPORT_BATCH_SIZE", 2):
+        response = client.get("/export/users", headers={"Accept-Encoding": "identity"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert "content-encoding" not in response.headers
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["user_id"] for line in lines] == [1, 2, 3, 4, 5]
+    assert lines[1] == {"user_id": 2, "username": "user2", "native_fruit": "Apple", "villagers": ["cat00", "cat01", "cat02"], "gyroids": ["gyroid0", "gyroid1"]}
+    # one users cursor plus two link queries per batch of two users
+    assert len(statement_counter) == 1 + 2 * 3
+
+def test_export_users_gzip(override_get_db_sqlite, island_users):
+    with client.stream("GET", "/export/users", headers={"Accept-Encoding": "gzip"}) as response:
+        raw = b"".join(response.iter_raw())
+
+    assert response.headers["content-encoding"] == "gzip"
+    lines = gzip.decompress(raw).decode().splitlines()
+    assert len(lines) == 5
+
 def test_create_user(override_get_db, db_session):
     user_data = {"user_id": 10, "username": "testuser", "native_fruit": "Apple"}
 
@@ -135,47 +828,325 @@ def test_add_villager_to_user(override_get_db, db_session):
     assert villager in user.villagers
     db_session.commit.assert_called_once()
 
-def test_add_villagers_to_database(override_get_db, db_session):
-    with patch("main.requests.get") as mock_get:
-        mock_get.return_value.status_code = 200
-        mock_get.return_value.json.return_value = [
-            {
-                "id": "cat00",
-                "name": "Bob",
-                "species": "cat",
-                "personality": "lazy",
-                "quote": "You only live once...or nine times."
-            },
-            {
-                "id": "cat08",
-                "name": "Moe",
-                "species": "cat",
-                "personality": "lazy",
-                "quote": "Ignorance is bliss."
-            }
-        ]
+def test_add_villager_to_user_async_session(override_get_db_sqlite, island_users, sqlite_session):
+    response = client.post("/users/1/villagers/cat03")
+
+    assert response.status_code == 200
+    assert response.json() == {"message": "Villager 'Cat 3' added to user 'user1' successfully"}
+    assert [villager.villager_id for villager in sqlite_session.get(models.Users, 1).villagers] == ["cat00", "cat01", "cat03"]
+
+def test_add_villagers_to_user_in_bulk(override_get_db_sqlite, island_users, sqlite_session, statement_counter):
+    response = client.post("/users/1/villagers", json=["cat00", "cat02", "cat03", "cat02", "dog99"])
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "message": "2 villagers added to user 'user1'",
+        "results": {"cat00": "already_present", "cat02": "added", "cat03": "added", "dog99": "not_found"},
+    }
+    # user lookup, one IN validation query, one INSERT, one island count upsert, COMMIT
+    assert len([s for s in statement_counter if not s.startswith(("BEGIN", "COMMIT"))]) == 4
+    assert sorted(villager.villager_id for villager in sqlite_session.get(models.Users, 1).villagers) == ["cat00", "cat01", "cat02", "cat03"]
+
+    assert client.post("/users/99/villagers", json=["cat00"]).status_code == 404
+
+def test_add_gyroids_to_user_in_bulk(override_get_db_sqlite, island_users, sqlite_session):
+    response = client.post("/users/3/gyroids", json=["gyroid1", "gyroid9"])
+
+    assert response.json() == {
+        "message": "1 gyroids added to user 'user3'",
+        "results": {"gyroid1": "added", "gyroid9": "not_found"},
+    }
+    assert [gyroid.gyroid_name for gyroid in sqlite_session.get(models.Users, 3).gyroids] == ["gyroid1"]
+
+def test_to_async_url():
+    assert database.to_async_url("postgresql://user:secret@db/acnh") == "postgresql+asyncpg://user:secret@db/acnh"
+    assert database.to_async_url("sqlite:///./acnh.db") == "sqlite+aiosqlite:///./acnh.db"
+
+def test_pool_options_size_file_sqlite_pools(tmp_path):
+    url = f"sqlite:///{tmp_path / 'pool.db'}"
+    assert create_engine(url, **database.pool_options(url)).pool.size() == database.DB_POOL_SIZE
+    async_url = database.to_async_url(url)
+    assert create_async_engine(async_url, **database.pool_options(async_url)).pool.size() == database.DB_POOL_SIZE
+
+    # in-memory pools take no size arguments
+    for url in ("sqlite://", "sqlite:///:memory:", "sqlite+aiosqlite://"):
+        assert "pool_size" not in database.pool_options(url)
+        (create_async_engine if "aiosqlite" in url else create_engine)(url, **database.pool_options(url))
+
+def test_add_villagers_to_database(override_get_db_sqlite, sqlite_session):
+    villagers_json = [
+        {
+            "id": "cat00",
+            "name": "Bob",
+            "species": "cat",
+            "personality": "lazy",
+            "quote": "You only live once...or nine times."
+        },
+        {
+            "id": "cat08",
+            "name": "Moe",
+            "species": "cat",
+            "personality": "lazy",
+            "quote": "Ignorance is bliss."
+        }
+    ]
+    with mock_upstream(villagers_json):
         response = client.post("/add_villagers")
 
-        assert response.status_code == 200
+    assert response.status_code == 200
+    assert response.json() == {"message": "Villagers added to database successfully", "inserted": 2, "updated": 0, "unchanged": 0}
 
-        assert response.json() == {"message": "Villagers added to database successfully"}
+    villagers_json[1] = {**villagers_json[1], "quote": "Sleep is bliss."}
+    with mock_upstream(villagers_json):
+        response = client.post("/add_villagers")
 
-        db_session.commit.assert_called_once()
+    assert response.json() == {"message": "Villagers added to database successfully", "inserted": 0, "updated": 1, "unchanged": 1}
+    assert sqlite_session.get(models.Villager, "cat08").quote == "Sleep is bliss."
 
-def test_add_gyroids_to_database(override_get_db, db_session): 
-    with patch("main.requests.get") as mock_get:
-        mock_get.return_value.status_code = 200
-        mock_get.return_value.json.return_value = [
-            {"name": "aluminoid", "sound":"Drum set"},
-            {"name": "brewstoid", "sound": "Snare"}
-        ]
+def test_add_gyroids_to_database(override_get_db_sqlite, sqlite_session):
+    with mock_upstream([
+        {"name": "aluminoid", "sound":"Drum set"},
+        {"name": "brewstoid", "sound": "Snare"}
+    ]):
         response = client.post("/add_gyroids")
 
-        assert response.status_code == 200
+    assert response.status_code == 200
+    assert response.json() == {"message": "Gyroids added to database successfully", "inserted": 2, "updated": 0, "unchanged": 0}
+
+    with mock_upstream([
+        {"name": "aluminoid", "sound":"Drum set"},
+        {"name": "brewstoid", "sound": "Snare"},
+        {"name": "bubbloid", "sound": "Melody"}
+    ]):
+        response = client.post("/add_gyroids")
+
+    assert response.json() == {"message": "Gyroids added to database successfully", "inserted": 1, "updated": 0, "unchanged": 2}
+    assert len(sqlite_session.exec(select(models.Gyroid)).all()) == 3
+
+class HeldElsewhereLock:
+    held = False
+
+    def acquire(self):
+        return False
+
+    def release(self):
+        pass
+
+def test_catalog_sync_applies_only_changed_catalogs(sqlite_session):
+    engine = sqlite_session.get_bind()
+    catalog_sync = CatalogSync(catalog_cache, engine, lock=SyncLock(engine))
+    villagers_json = [{"id": "cat00", "name": "Bob", "species": "cat", "personality": "lazy", "quote": "You only live once...or nine times."}]
+    gyroids_json = [{"name": "bubbloid", "sound": "Melody"}]
+
+    async def upstream_get(path, **kwargs):
+        return httpx.Response(200, json=villagers_json if path == "/villagers" else gyroids_json)
+
+    with patch("main.upstream_client.get", new=upstream_get), patch("sync.fcntl", None):
+        first = asyncio.run(catalog_sync.run_once())
+        second = asyncio.run(catalog_sync.run_once())
+        gyroids_json.append({"name": "aluminoid", "sound": "Drum set"})
+        third = asyncio.run(catalog_sync.run_once())
+
+    assert first["villagers"] == {"inserted": 1, "updated": 0, "unchanged": 0}
+    assert first["gyroids"] == {"inserted": 1, "updated": 0, "unchanged": 0}
+    assert second == {"leader": True, "unchanged": ["villagers", "gyroids"]}
+    assert third == {"leader": True, "unchanged": ["villagers"], "gyroids": {"inserted": 1, "updated": 0, "unchanged": 1}}
+    assert sqlite_session.get(models.Gyroid, "aluminoid").sound == "Drum set"
 
-        assert response.json() == {"message": "Gyroids added to database successfully"}
+def test_catalog_sync_follower_loads_from_database(sqlite_session):
+    sqlite_session.add(models.Villager(villager_id="cat00", name="Bob", species="cat", personality="lazy", quote="You only live once...or nine times."))
+    sqlite_session.commit()
+    catalog_sync = CatalogSync(catalog_cache, sqlite_session.get_bind(), lock=HeldElsewhereLock())
 
-        db_session.commit.assert_called_once()
+    with patch("main.upstream_client.get", new=AsyncMock()) as mock_get:
+        result = asyncio.run(catalog_sync.run_once())
+        response = client.get("/villagers?species=cat")
+
+    assert result == {"leader": False, "loaded": {"villagers": 1, "gyroids": 0}}
+    assert response.json()[0]["villager_id"] == "cat00"
+    mock_get.assert_not_awaited()
+
+def test_catalog_sync_leader_and_follower_agree_on_digest(sqlite_session):
+    villagers_json = [
+        {"id": "cat21", "name": "Katt", "species": "cat", "personality": "big sister", "quote": "MeowMEOWmeow!"},
+        {"id": "cat00", "name": "Bob", "species": "cat", "personality": "lazy", "quote": "You only live once...or nine times."},
+    ]
+    gyroids_json = [{"name": "bubbloid", "sound": "Melody"}, {"name": "boomoid", "sound": "Drum set"}]
+
+    engine = sqlite_session.get_bind()
+    follower_cache = catalog.CatalogCache(None)
+
+    async def upstream_get(path, **kwargs):
+        return httpx.Response(200, json=villagers_json if path == "/villagers" else gyroids_json)
+
+    with patch("main.upstream_client.get", new=upstream_get), patch("sync.fcntl", None):
+        asyncio.run(CatalogSync(catalog_cache, engine, lock=SyncLock(engine)).run_once())
+    asyncio.run(CatalogSync(follower_cache, engine, lock=HeldElsewhereLock()).run_once())
+
+    for resource in ("villagers", "gyroids"):
+        leader, follower = catalog_cache.peek(resource), follower_cache.peek(resource)
+        assert leader.items == follower.items
+        assert leader.digest == follower.digest
+    assert [villager.villager_id for villager in follower_cache.peek("villagers").items] == ["cat00", "cat21"]
+
+def test_sync_lock_is_exclusive(tmp_path):
+    engine = create_engine("sqlite://")
+    first = SyncLock(engine, path=str(tmp_path / "sync.lock"))
+    second = SyncLock(engine, path=str(tmp_path / "sync.lock"))
+
+    assert first.acquire()
+    assert not second.acquire()
+    first.release()
+    assert second.acquire()
+    second.release()
+
+def test_sync_lock_leaves_no_transaction_open():
+    engine = create_engine("sqlite://")
+
+    @event.listens_for(engine, "connect")
+    def advisory_lock_functions(dbapi_connection, connection_record):
+        dbapi_connection.create_function("pg_try_advisory_lock", 1, lambda key: True)
+        dbapi_connection.create_function("pg_advisory_unlock", 1, lambda key: True)
+
+    lock = SyncLock(engine)
+    with patch.object(engine.dialect, "name", "postgresql"):
+        assert lock.acquire()
+        assert not lock._connection.in_transaction()
+        # the liveness ping on the next tick does not leave one open either
+        assert lock.acquire()
+        assert not lock._connection.in_transaction()
+        lock.release()
+    assert not lock.held
+
+def test_sync_lock_notices_a_dropped_advisory_lock():
+    connections = []
+
+    def connect():
+        connection = MagicMock()
+        connection.execute.return_value.scalar.return_value = True
+        connections.append(connection)
+        return connection
+
+    engine = MagicMock()
+    engine.dialect.name = "postgresql"
+    engine.connect.side_effect = connect
+    lock = SyncLock(engine)
+
+    assert lock.acquire()
+    assert lock.acquire()
+    assert len(connections) == 1
+
+    # the session died, so the server released the lock; it has to be taken again
+    connections[0].execute.side_effect = DBAPIError("SELECT 1", {}, Exception("server closed the connection"))
+    assert lock.acquire()
+    assert len(connections) == 2
+    connections[0].close.assert_called_once()
+
+    lock.release()
+    assert not lock.held
+    connections[1].close.assert_called_once()
+
+def test_shared_catalog_publishes_to_followers(tmp_path):
+    gyroid_payloads = [[{"name": "bubbloid", "sound": "Melody"}]]
+    leader_calls, follower_calls = [], []
+
+    def handler(request):
+        leader_calls.append(request.url.path)
+        if request.url.path == "/villagers":
+            return httpx.Response(200, json=SEARCH_VILLAGERS)
+        return httpx.Response(200, json=gyroid_payloads[-1], headers={"ETag": f'"v{len(gyroid_payloads)}"'})
+
+    def shared_catalog(transport):
+        cache = catalog.CatalogCache(UpstreamClient("https://upstream.test", {}, transport=httpx.MockTransport(transport)))
+        return SharedCatalog(cache, path=str(tmp_path / "catalog.shared"))
+
+    leader = shared_catalog(handler)
+    follower = shared_catalog(follower_calls.append)
+
+    async def scenario():
+        await leader.run_once()
+        await follower.run_once()
+        assert (leader.publishes, follower.loads) == (1, 1)
+        assert leader.stats()["leader"] and not follower.stats()["leader"]
+        assert follower.stamp == leader.stamp
+        assert [gyroid.name for gyroid in (await follower.catalog_cache.get("gyroids")).items] == ["bubbloid"]
+        assert (await follower.catalog_cache.get("villagers")).etag is None
+
+        # nothing expired: no upstream call, nothing published, nothing reloaded
+        await leader.run_once()
+        await follower.run_once()
+        assert (leader.publishes, follower.loads, len(leader_calls)) == (1, 1, 2)
+
+        gyroid_payloads.append([{"name": "boomoid", "sound": "Drum set"}])
+        leader.catalog_cache.ttl = 0
+        await leader.run_once()
+        await follower.run_once()
+        assert (leader.publishes, follower.loads) == (2, 2)
+        entry = await follower.catalog_cache.get("gyroids")
+        assert [gyroid.name for gyroid in entry.items] == ["boomoid"]
+        assert entry.etag == '"v2"'
+
+        # the leader stepping down hands the lock to the next worker that ticks
+        await leader.stop()
+        await follower.run_once()
+        assert follower.stats()["leader"]
+        assert not follower.catalog_cache.follower
+        await follower.stop()
+        await leader.catalog_cache.upstream_client.close()
+
+    asyncio.run(scenario())
+    assert follower_calls == []
+
+def test_shared_catalog_followers_wait_for_the_leader(tmp_path):
+    leader_calls, follower_calls = [], []
+
+    def handler(request):
+        leader_calls.append(request.url.path)
+        if len(leader_calls) > 2:
+            return httpx.Response(503)
+        return httpx.Response(200, json=SEARCH_VILLAGERS if request.url.path == "/villagers" else SEARCH_GYROIDS)
+
+    def shared_catalog(transport, path):
+        cache = catalog.CatalogCache(UpstreamClient("https://upstream.test", {}, transport=httpx.MockTransport(transport)))
+        return SharedCatalog(cache, path=str(tmp_path / path))
+
+    leader = shared_catalog(handler, "catalog.shared")
+    follower = shared_catalog(follower_calls.append, "catalog.shared")
+    cold_follower = shared_catalog(follower_calls.append, "unpublished.shared")
+    # same host as the others, so it competes for the leader's lock, but its file has not been published
+    cold_follower.lock = SyncLock(None, path=str(tmp_path / "catalog.shared.lock"))
+
+    async def scenario():
+        # a follower that ticks before anything is published has nothing to serve, but does not go upstream
+        await leader.run_once()
+        await cold_follower.run_once()
+        assert cold_follower.catalog_cache.follower
+        with pytest.raises(UpstreamError) as error:
+            await cold_follower.catalog_cache.get("gyroids")
+        assert error.value.status_code == 503
+
+        await follower.run_once()
+        assert follower.catalog_cache.follower
+
+        # upstream goes down and every entry expires: the leader's refresh fails, followers keep the old copy
+        leader.catalog_cache.ttl = follower.catalog_cache.ttl = 0
+        follower.catalog_cache.stale_ttl = 0
+        await leader.run_once()
+        await follower.run_once()
+        assert leader.publishes == 1
+        entry = await follower.catalog_cache.get("gyroids")
+        assert [gyroid.name for gyroid in entry.items] == ["boomoid", "bubbloid"]
+        follower.catalog_cache.revalidate_if_stale("villagers")
+        assert len((await follower.catalog_cache.get("villagers")).items) == 3
+        assert follower.catalog_cache.stats()["gyroids"]["stale_hits"] == 1
+
+        await leader.stop()
+        await leader.catalog_cache.upstream_client.close()
+
+    with patch("upstream.UPSTREAM_RETRIES", 0):
+        asyncio.run(scenario())
+    assert len(leader_calls) == 4
+    assert follower_calls == []
 
 def test_add_gyroid_to_user(override_get_db, db_session):
     user_id = 1
@@ -218,45 +1189,74 @@ def test_update_username(override_get_db, db_session):
     assert user.username == new_username
     db_session.commit.assert_called_once()
 
-def test_update_user_villagers(override_get_db, db_session):
+def test_update_user_villagers(override_get_db_sqlite, island_users, sqlite_session, statement_counter):
     user_id = 1
     old_villager_id = "cat00"
-    new_villager_id = "cat21"
-    old_villager_name = "Bob"
-    new_villager_name = "Katt"
-    user = models.Users(
-        user_id=user_id,
-        username="user1",
-        native_fruit="Apple"
-    )
-    old_villager = models.Villager(
-        villager_id=old_villager_id,
-        name=old_villager_name,
-        species="cat",
-        personality="lazy",
-        quote="You only live once...or nine times."
-    )
-    new_villager = models.Villager(
-        villager_id=new_villager_id,
-        name=new_villager_name,
-        species="cat",
-        personality="big sister",
-        quote="MeowMEOWmeow!"
-    )
-
-    db_session.get.return_value = user
-    db_session.exec.return_value.first.side_effect = [old_villager, new_villager]
+    new_villager_id = "cat03"
 
     response = client.patch(f"/users/{user_id}/villagers/{old_villager_id}/switch/{new_villager_id}")
 
     assert response.status_code == 200
 
-    expected_message = f"Villager '{old_villager.name}' switched to '{new_villager.name}' successfully"
+    expected_message = "Villager 'Cat 0' switched to 'Cat 3' successfully"
     assert response.json() == {"message": expected_message}
 
-    assert old_villager not in user.villagers
-    assert new_villager in user.villagers
-    db_session.commit.assert_called_once()
+    assert [villager.villager_id for villager in sqlite_session.get(models.Users, user_id).villagers] == ["cat01", "cat03"]
+    # user lookup, villager lookup, one UPDATE on the link table, one island count upsert
+    assert len([s for s in statement_counter if s.startswith("UPDATE")]) == 1
+    assert len([s for s in statement_counter if not s.startswith(("BEGIN", "COMMIT"))]) == 4
+
+def test_island_stats_follow_writes(override_get_db_sqlite, island_users, sqlite_session):
+    analytics.rebuild(sqlite_session)
+    sqlite_session.commit()
+
+    assert client.get("/stats/villagers", params={"limit": 2}).json() == [
+        {"id": "cat00", "name": "Cat 0", "islands": 5},
+        {"id": "cat01", "name": "Cat 1", "islands": 4},
+    ]
+
+    assert client.post("/users/3/gyroids", json=["gyroid1"]).status_code == 200
+    assert client.post("/users/4/villagers/cat02").status_code == 200
+    assert client.patch("/users/1/villagers/cat00/switch/cat03").status_code == 200
+    # a self-swap changes nothing, so it must not count the villager twice
+    assert client.patch("/users/1/villagers/cat01/switch/cat01").status_code == 409
+    assert client.delete("/users/5/villagers/cat01").status_code == 200
+    assert client.delete("/users/2").status_code == 200
+    assert client.post("/users", json={"user_id": 6, "username": "user6", "native_fruit": "Pear"}).status_code == 200
+
+    expected_villagers = [
+        {"id": "cat00", "name": "Cat 0", "islands": 3},
+        {"id": "cat01", "name": "Cat 1", "islands": 2},
+        {"id": "cat02", "name": "Cat 2", "islands": 2},
+        {"id": "cat03", "name": "Cat 3", "islands": 2},
+    ]
+    expected_gyroids = [
+        {"id": "gyroid0", "name": "gyroid0", "islands": 3},
+        {"id": "gyroid1", "name": "gyroid1", "islands": 2},
+    ]
+    expected_fruit = [
+        {"key": "Apple", "count": 4, "share": 0.8},
+        {"key": "Pear", "count": 1, "share": 0.2},
+    ]
+    assert client.get("/stats/villagers").json() == expected_villagers
+    assert client.get("/stats/gyroids").json() == expected_gyroids
+    assert client.get("/stats/fruit").json() == expected_fruit
+    assert client.get("/stats/species").json() == [{"key": "cat", "count": 9, "share": 1.0}]
+    assert client.get("/stats/personalities").json() == [{"key": "lazy", "count": 9, "share": 1.0}]
+    assert client.get("/stats/villagers", params={"limit": 0}).status_code == 422
+
+    # the incremental counts agree with a full recount
+    analytics.rebuild(sqlite_session)
+    sqlite_session.commit()
+    assert client.get("/stats/villagers").json() == expected_villagers
+    assert client.get("/stats/gyroids").json() == expected_gyroids
+    assert client.get("/stats/fruit").json() == expected_fruit
+
+def test_update_user_villagers_conflicts(override_get_db_sqlite, island_users):
+    assert client.patch("/users/1/villagers/cat00/switch/cat01").status_code == 409
+    assert client.patch("/users/1/villagers/cat00/switch/cat00").json() == {"detail": "Old and new villager are the same"}
+    assert client.patch("/users/1/villagers/cat02/switch/cat03").status_code == 404
+    assert client.patch("/users/1/villagers/cat00/switch/dog99").json() == {"detail": "New villager not found"}
 
 def test_delete_user(override_get_db, db_session):
     user_id = 1
@@ -278,36 +1278,22 @@ def test_delete_user(override_get_db, db_session):
     db_session.delete.assert_called_once_with(user)
     db_session.commit.assert_called_once()
 
-def test_delete_villager_from_user(override_get_db, db_session):
-    user_id = 1
-    villager_id = "cat00"
-    villager_name = "Bob"
-    user = models.Users(
-        user_id=user_id,
-        username="user1",
-        native_fruit="Apple"
-    )
-    villager = models.Villager(
-        villager_id=villager_id,
-        villager_name=villager_name,
-        species="cat",
-        personality="lazy",
-        quote="You only live once...or nine times."
-    )
-
-    user.villagers.append(villager)
-
-    db_session.get.return_value = user
+def test_delete_villager_from_user(override_get_db_sqlite, island_users, sqlite_session):
+    user_id = 2
+    villager_id = "cat01"
 
     response = client.delete(f"/users/{user_id}/villagers/{villager_id}")
 
     assert response.status_code == 200
 
-    assert response.json() == {"message": f"Villager '{villager.name}' deleted from user {user.username}' successfully"}
+    assert response.json() == {"message": "Villager 'Cat 1' deleted from user user2' successfully"}
 
-    assert villager not in user.villagers
-    db_session.delete.assert_called_once_with(villager)
-    db_session.commit.assert_called_once()
+    assert [villager.villager_id for villager in sqlite_session.get(models.Users, user_id).villagers] == ["cat00", "cat02"]
+    # the shared catalog row and other islands are untouched
+    assert sqlite_session.get(models.Villager, villager_id) is not None
+    assert "cat01" in [villager.villager_id for villager in sqlite_session.get(models.Users, 3).villagers]
+
+    assert client.delete(f"/users/{user_id}/villagers/{villager_id}").status_code == 404
 
 
 def main():
@@ -0,0 +1,262 @@
+from decouple import config
+import httpx
+
+import metrics
+
+from email.utils import parsedate_to_datetime
+import asyncio
+import datetime
+import time
+
+
+UPSTREAM_TIMEOUT = config("UPSTREAM_TIMEOUT", default=10.0, cast=float)
+UPSTREAM_CONNECT_TIMEOUT = config("UPSTREAM_CONNECT_TIMEOUT", default=5.0, cast=float)
+UPSTREAM_RETRIES = config("UPSTREAM_RETRIES", default=2, cast=int)
+UPSTREAM_RETRY_BACKOFF = config("UPSTREAM_RETRY_BACKOFF", default=0.2, cast=float)
+UPSTREAM_MAX_CONNECTIONS = config("UPSTREAM_MAX_CONNECTIONS", default=100, cast=int)
+UPSTREAM_MAX_KEEPALIVE = config("UPSTREAM_MAX_KEEPALIVE", default=20, cast=int)
+UPSTREAM_RETRY_AFTER_MAX = config("UPSTREAM_RETRY_AFTER_MAX", default=5.0, cast=float)
+UPSTREAM_BREAKER_THRESHOLD = config("UPSTREAM_BREAKER_THRESHOLD", default=5, cast=int)
+UPSTREAM_BREAKER_RESET = config("UPSTREAM_BREAKER_RESET", default=5.0, cast=float)
+UPSTREAM_BREAKER_MAX_RESET = config("UPSTREAM_BREAKER_MAX_RESET", default=300.0, cast=float)
+UPSTREAM_RATE_LIMIT = config("UPSTREAM_RATE_LIMIT", default=5.0, cast=float)
+UPSTREAM_RATE_BURST = config("UPSTREAM_RATE_BURST", default=10, cast=int)
+UPSTREAM_RATE_LIMIT_WAIT = config("UPSTREAM_RATE_LIMIT_WAIT", default=2.0, cast=float)
+
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+FAILURE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: float | None = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(UpstreamError):
+    def __init__(self, retry_after: float):
+        super().__init__(503, "Upstream API is temporarily unavailable", retry_after=retry_after)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Seconds to wait from a ``Retry-After`` header, given as seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max((when - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0.0)
+
+
+class CircuitBreaker:
+    """Stops calling an upstream that keeps failing.
+
+    After ``threshold`` consecutive failed calls, or as soon as upstream asks
+    us to back off with ``Retry-After``, the circuit opens and calls fail
+    immediately with ``CircuitOpenError``. Once the open period is over one
+    probe call is let through: success closes the circuit, failure opens it
+    again for twice as long, up to ``max_reset_timeout``.
+    """
+
+    def __init__(self, threshold: int = UPSTREAM_BREAKER_THRESHOLD, reset_timeout: float = UPSTREAM_BREAKER_RESET, max_reset_timeout: float = UPSTREAM_BREAKER_MAX_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.reset()
+
+    def reset(self):
+        self.failures = 0
+        self.trips = 0
+        self.opened_until: float | None = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_until is None:
+            return "closed"
+        if self.probing or time.monotonic() < self.opened_until:
+            return "open"
+        return "half_open"
+
+    @property
+    def retry_after(self) -> float:
+        if self.opened_until is None:
+            return 0.0
+        return max(self.opened_until - time.monotonic(), 0.0)
+
+    def check(self):
+        """Raise ``CircuitOpenError`` unless a call may go through now."""
+        if self.opened_until is None:
+            return
+        if self.probing or time.monotonic() < self.opened_until:
+            raise CircuitOpenError(self.retry_after or self.reset_timeout)
+        self.probing = True
+
+    def record_success(self):
+        self.reset()
+
+    def record_failure(self, retry_after: float | None = None):
+        self.failures += 1
+        if self.probing or self.failures >= self.threshold or retry_after:
+            timeout = min(self.reset_timeout * 2 ** self.trips, self.max_reset_timeout)
+            self.trips += 1
+            self.opened_until = time.monotonic() + max(timeout, retry_after or 0.0)
+        self.probing = False
+
+    def record_cancelled(self):
+        # a cancelled probe says nothing about upstream; let the next call probe instead
+        self.probing = False
+
+
+class TokenBucket:
+    """Client-side rate limit for our API key quota.
+
+    Holds up to ``capacity`` tokens, refilled at ``rate`` per second. A call
+    that finds the bucket empty reserves the next token and sleeps until it
+    is due, or fails with a 503 if that is more than ``max_wait`` away. A
+    ``rate`` of zero disables the limit.
+    """
+
+    def __init__(self, rate: float = UPSTREAM_RATE_LIMIT, capacity: int = UPSTREAM_RATE_BURST, max_wait: float = UPSTREAM_RATE_LIMIT_WAIT):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_wait = max_wait
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.throttled = 0
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        self.tokens = min(self.tokens + (now - self.updated) * self.rate, self.capacity)
+        self.updated = now
+        wait = (1 - self.tokens) / self.rate
+        if wait > self.max_wait:
+            raise UpstreamError(503, "Upstream API rate limit reached", retry_after=wait)
+        self.tokens -= 1
+        if wait > 0:
+            self.throttled += 1
+            await asyncio.sleep(wait)
+
+
+class UpstreamClient:
+    """Shared keep-alive client for the Nookipedia API.
+
+    One instance is opened per worker by the app lifespan and reused by every
+    request, so upstream calls never block the event loop and reuse pooled
+    connections instead of opening a new one per call.
+
+    Every call first passes the circuit breaker and the token bucket, so
+    while upstream is down or we are out of quota callers fail in
+    microseconds instead of waiting for timeouts.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        headers: dict[str, str],
+        transport: httpx.AsyncBaseTransport | None = None,
+        breaker: CircuitBreaker | None = None,
+        bucket: TokenBucket | None = None,
+    ):
+        self.base_url = base_url
+        self.headers = headers
+        self.transport = transport
+        self.breaker = breaker or CircuitBreaker()
+        self.bucket = bucket or TokenBucket()
+        self._client: httpx.AsyncClient | None = None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={k: v for k, v in self.headers.items() if v is not None},
+            timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+            transport=self.transport or httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(
+                    max_connections=UPSTREAM_MAX_CONNECTIONS,
+                    max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+                ),
+            ),
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+
+    async def start(self):
+        self.client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        return {
+            "circuit": self.breaker.state,
+            "failures": self.breaker.failures,
+            "trips": self.breaker.trips,
+            "retry_after": round(self.breaker.retry_after, 3),
+            "throttled": self.bucket.throttled,
+        }
+
+    async def get(self, path: str, stream: bool = False, **kwargs) -> httpx.Response:
+        """GET ``path``, retrying timeouts, gateway errors and 429s.
+
+        Raises ``CircuitOpenError`` without touching the network while the
+        circuit is open. With ``stream=True`` the body is left unread for the
+        caller to iterate, and the caller must ``aclose()`` the response.
+        """
+        self.breaker.check()
+        try:
+            response = await self._get_with_retries(path, stream, **kwargs)
+        except (httpx.TimeoutException, httpx.NetworkError):
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.record_cancelled()
+            raise
+        if response.status_code in FAILURE_STATUS_CODES:
+            self.breaker.record_failure(parse_retry_after(response.headers.get("Retry-After")))
+        else:
+            self.breaker.record_success()
+        return response
+
+    async def _get_with_retries(self, path: str, stream: bool, **kwargs) -> httpx.Response:
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            start = time.perf_counter()
+            delay = UPSTREAM_RETRY_BACKOFF * 2 ** attempt
+            try:
+                response = await self.client.send(self.client.build_request("GET", path, **kwargs), stream=stream)
+            except (httpx.TimeoutException, httpx.NetworkError) as exc:
+                metrics.observe_upstream(path, type(exc).__name__, time.perf_counter() - start)
+                if attempt >= UPSTREAM_RETRIES:
+                    raise
+            else:
+                metrics.observe_upstream(path, response.status_code, time.perf_counter() - start)
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= UPSTREAM_RETRIES:
+                    return response
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if retry_after is not None:
+                    if retry_after > UPSTREAM_RETRY_AFTER_MAX:
+                        # too long to wait inside a request; the breaker holds callers off instead
+                        return response
+                    delay = max(delay, retry_after)
+                if stream:
+                    await response.aclose()
+            attempt += 1
+            await asyncio.sleep(delay)